@@ -1,43 +1,76 @@
+import argparse
+import base64
+import email.policy
+import importlib
+import io
+import itertools
+import atexit
+import bisect
 import logging
+import logging.handlers
+import marshal
 import os
 import random
+import signal
 import smtplib
+import socket
 import re, uuid, os
 import mimetypes
 import sys
+import tempfile
+import queue
 import threading
 import time
 import json
-import pythoncom
-from email import encoders
+import csv
+import sqlite3
+import hashlib
+import heapq
+import html
+import mmap
+import struct
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import deque
+from datetime import datetime, timedelta
+from email.generator import BytesGenerator
 from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
-from tkinter import (
-    END,
-    Button,
-    Entry,
-    Frame,
-    Label,
-    OptionMenu,
-    Scrollbar,
-    StringVar,
-    Text,
-    Tk,
-    Toplevel,
-    filedialog,
-    messagebox,
-    scrolledtext,
-    ttk,
-)
 
-import extract_msg
-import pandas as pd
-import RTFDE.text_extraction as rtf_te
-import win32com.client as win32
-from openpyxl import load_workbook
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    Keeps heavy (pandas, extract_msg), Windows-only (pywin32) and GUI
+    (tkinter) modules out of startup and of runs that never touch them;
+    ``benchmarks/startup.py`` checks that they stay deferred.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pd = LazyModule("pandas")
+extract_msg = LazyModule("extract_msg")
+pythoncom = LazyModule("pythoncom")
+win32 = LazyModule("win32com.client")
+tk = LazyModule("tkinter")
+filedialog = LazyModule("tkinter.filedialog")
+messagebox = LazyModule("tkinter.messagebox")
+scrolledtext = LazyModule("tkinter.scrolledtext")
+ttk = LazyModule("tkinter.ttk")
+asyncio = LazyModule("asyncio")
+futures = LazyModule("concurrent.futures")
+multiprocessing = LazyModule("multiprocessing")
 
 # ─────────────────────────────
 # ⚙️ Config & Log
@@ -52,16 +85,121 @@ DEFAULT_CLOSING_STATEMENTS = [
     "Gratefully",
     "Warm regards",
 ]
-DELAY_SEND = 10
-DELAY_DRAFT = 1
-LOG_FILE = "automailer_log.txt"
-logging.basicConfig(
-    filename=LOG_FILE, level=logging.INFO, format="%(asctime)s - %(message)s"
+# 寄送速率（僅 send 模式；存稿不限速）
+RATE_PER_SECOND = 1.0
+RATE_PER_MINUTE = 30
+RATE_RAMP_START = 0.25  # 閒置後先以 25% 速率起步，逐封回升
+RATE_RAMP_STEP = 0.05
+RATE_QUIET_SECONDS = 60
+RATE_BACKOFF_SECONDS = 15  # 收到 4xx 節流回應後暫停秒數，連續發生則加倍
+RATE_BACKOFF_MAX = 300
+RETRY_ATTEMPTS = 3  # 暫時性錯誤（4xx、斷線、逾時）最多重寄幾次；0 表示不重寄
+RETRY_BASE_SECONDS = 30  # 第一次重寄前的等待秒數，之後每次加倍（含隨機抖動）
+RETRY_MAX_SECONDS = 900
+DEAD_LETTER_DIR = "dead_letters"  # 重寄用盡仍失敗的收件人，可直接當收件人名單再寄
+SUPPRESSION_DIR = "suppression"  # 排除清單永久索引（相對於程式目錄）
+JOURNAL_DIR = "journals"  # 每個寄送活動的寄送紀錄（供中斷後續寄）
+QUOTA_FILE = "quotas.json"  # 多帳號寄送時各帳號最近 24 小時的寄送時間
+METRICS_DIR = "metrics"  # 各階段耗時統計的輸出資料夾；空字串表示不輸出
+METRICS_INTERVAL = 0  # 寄送期間每隔幾秒輸出一次；0 表示只在結束時輸出
+# 耗時直方圖的上界（秒）
+METRICS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
 )
+SMTP_TIMEOUT = 60
+SMTP_MAX_PER_CONNECTION = 500  # 多數服務商會限制單一連線可寄送的封數
+SEND_WORKERS = 1  # 同時寄送的 SMTP 工作執行緒數（Outlook 固定為 1）
+SEND_QUEUE_PER_WORKER = 4  # 每個工作執行緒預先套版、排隊等待寄送的封數
+RENDER_PROCESSES = 0  # 套版行程數；0 表示名單夠大時自動使用全部核心，1 表示在本執行緒套版
+RENDER_POOL_MIN_ROWS = 20000  # 自動模式下，名單估計超過這麼多列才啟用行程池
+RENDER_CHUNK_ROWS = 200  # 每次交給套版行程的列數
+RENDER_CHUNKS_PER_PROCESS = 2  # 每個行程最多預先套版幾批（背壓）
+SMTP_BATCH_RCPT = 0  # 內容完全相同的信最多幾位收件人合併成一筆交易；0 或 1 表示不合併
+BATCH_WINDOW_ROWS = 1000  # 等待合併的信最多延後幾列就先寄出
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+DRAFT_FSYNC_EVERY = 200  # SMTP 存稿每寫入幾封才 fsync 一次
+MIME_READ_CHUNK = 57 * 4096  # 圖片／附件每次讀取的位元組數（57 的倍數，base64 剛好整行）
+SOCKET_WRITE_CHUNK = 256 * 1024  # asyncio 寫入 DATA 時每段的大小，限制每條連線的緩衝
+TEMPLATE_CACHE_DIR = Path(".cache") / "templates"
+TEMPLATE_CACHE_VERSION = 1  # 解析方式改變時遞增，讓舊快取失效
+IMAGE_CACHE_DIR = Path(".cache") / "images"
+IMAGE_CACHE_VERSION = 1  # 最佳化方式改變時遞增，讓舊快取失效
+IMAGE_MAX_WIDTH = 0  # 嵌入圖片的最大寬度（像素）；預設 0 不最佳化，設成例如 1200 才啟用
+IMAGE_QUALITY = 85  # JPEG 重新壓縮的品質
+RECIPIENT_CACHE_DIR = Path(".cache") / "recipients"
+RECIPIENT_CACHE_VERSION = 1  # 快取格式改變時遞增，讓舊快取失效
+RECIPIENT_CACHE_BLOCK = 10000  # 收件人快取每個區塊的列數
+WORKBOOK_INDEX_DIR = Path(".cache") / "workbooks"
+WORKBOOK_INDEX_VERSION = 1  # 索引格式改變時遞增，讓舊索引失效
+PROGRESS_POLL_MS = 250  # GUI 每隔幾毫秒讀一次進度
+PROGRESS_RATE_WINDOW = 200  # 以最近幾封計算寄送速率與剩餘時間
+# 可由 settings.json 覆寫的進階參數，會原樣傳給 run_automailer
+TUNING_DEFAULTS = {
+    "smtp_max_per_connection": SMTP_MAX_PER_CONNECTION,
+    "smtp_starttls": True,
+    "smtp_async": False,
+    "smtp_accounts": [],
+    "smtp_batch_rcpt": SMTP_BATCH_RCPT,
+    "send_workers": SEND_WORKERS,
+    "render_processes": RENDER_PROCESSES,
+    "rate_per_second": RATE_PER_SECOND,
+    "rate_per_minute": RATE_PER_MINUTE,
+    "retry_attempts": RETRY_ATTEMPTS,
+    "retry_base_seconds": RETRY_BASE_SECONDS,
+    "dead_letter_dir": DEAD_LETTER_DIR,
+    "suppression_dir": SUPPRESSION_DIR,
+    "journal_dir": JOURNAL_DIR,
+    "metrics_dir": METRICS_DIR,
+    "metrics_interval": METRICS_INTERVAL,
+    "image_max_width": IMAGE_MAX_WIDTH,
+    "image_quality": IMAGE_QUALITY,
+}
+LOG_FILE = "automailer_log.txt"
+LOG_MAX_BYTES = 5 * 1024 * 1024  # 超過就輪替成 automailer_log.txt.1 …
+LOG_BACKUP_COUNT = 3
+LOG_BUFFER_LINES = 5000  # 記憶體與日誌視窗最多保留幾行
+LOG_FLUSH_MS = 200  # 日誌視窗每隔幾毫秒批次寫入一次
+
+_log_listener = None
+_log_file_handler = None
+
+
+def setup_logging():
+    """檔案日誌改由背景執行緒寫入：呼叫端只把紀錄丟進佇列，不必等磁碟 I/O。"""
+    global _log_listener, _log_file_handler
+    if _log_listener is not None:
+        return
+    _log_file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    _log_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    log_queue = queue.Queue(-1)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, _log_file_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # 結束前把佇列裡剩下的紀錄寫完
+
+
+def rollover_log():
+    """把目前的日誌檔輪替掉，新的紀錄從空檔案開始。"""
+    if _log_listener is None:
+        return
+    _log_listener.stop()  # 先寫完佇列中較早的紀錄，才不會跑到新檔案裡
+    try:
+        _log_file_handler.doRollover()
+    finally:
+        _log_listener.start()
 
 
 def patch_rtfde_decode() -> None:
     """Patch RTFDE to ignore undecodable hex characters."""
+    import RTFDE.text_extraction as rtf_te
 
     def _patched_decode_hex_char(item: bytes, codec: str | None):
         if codec is None:
@@ -74,7 +212,83 @@ def patch_rtfde_decode() -> None:
     rtf_te.decode_hex_char = _patched_decode_hex_char
 
 
-patch_rtfde_decode()
+_rtfde_patched = False
+
+
+def read_msg_template(msg_template_path, logger):
+    """解析 .msg 範本，回傳 (主旨, HTML 內文, 切好的 tokens)。
+
+    結果以檔案內容的 SHA-256 為鍵快取在 TEMPLATE_CACHE_DIR；命中時完全不必
+    載入 extract_msg 或解析 RTF。
+    """
+    with open(msg_template_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cache_file = get_base_dir() / TEMPLATE_CACHE_DIR / f"{digest}.json"
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == TEMPLATE_CACHE_VERSION and cached["html"].strip():
+            return cached["subject"], cached["html"], cached["tokens"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if Path(msg_template_path).suffix.lower() in (".html", ".htm"):
+        subject, html_body = read_html_template(msg_template_path)
+    else:
+        subject, html_body = parse_msg_template(msg_template_path, logger)
+    tokens = tokenize_template(html_body)
+    if not html_body.strip():
+        # 解碼失敗或內文為空時不寫入快取，下次仍重新解析並再次提示
+        logger(f"範本內文為空，未寫入快取: {msg_template_path}")
+        return subject, html_body, tokens
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": TEMPLATE_CACHE_VERSION,
+                    "subject": subject,
+                    "html": html_body,
+                    "tokens": tokens,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logging.error(f"Failed to cache template: {e}")
+    return subject, html_body, tokens
+
+
+def read_html_template(path):
+    """純 HTML 範本：主旨取自 <title>，沒有則用檔名。"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        html_body = f.read()
+    title = re.search(r"<title[^>]*>(.*?)</title>", html_body, re.IGNORECASE | re.DOTALL)
+    subject = html.unescape(title.group(1).strip()) if title else Path(path).stem
+    return subject, html_body
+
+
+def parse_msg_template(msg_template_path, logger):
+    """用 extract_msg 解析 .msg，回傳 (主旨, HTML 內文)；第一次解析時才套用 RTFDE 修補。"""
+    global _rtfde_patched
+    if not _rtfde_patched:
+        patch_rtfde_decode()
+        _rtfde_patched = True
+    msg = extract_msg.Message(msg_template_path)
+    subject = msg.subject
+    try:
+        raw_html_body = msg.htmlBody
+    except UnicodeDecodeError as e:
+        logger(f"HTML 解析失敗: {e}")
+        raw_html_body = None
+    html_body = (
+        raw_html_body.decode("utf-8", errors="ignore")
+        if isinstance(raw_html_body, bytes)
+        else (raw_html_body or "")
+    )
+    return subject, html_body
 
 # Excel 全表識別
 ALL_SHEETS = "整本活頁簿"
@@ -85,7 +299,11 @@ ALL_SHEETS = "整本活頁簿"
 
 
 class EmailBackend:
-    """Email backend base class."""
+    """Email backend base class.
+
+    ``send`` may return the server's response text, which is kept in the
+    send journal.
+    """
 
     def send(
         self,
@@ -95,9 +313,28 @@ class EmailBackend:
         html_body: str,
         embedded_images: dict[str, Path],
         attachments: list[Path],
-    ) -> None:
+    ) -> str | None:
+        raise NotImplementedError
+
+    def send_batch(
+        self,
+        mode: str,
+        recipients: list[str],
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> tuple[str | None, dict]:
+        """Send one identical message to several recipients in one transaction.
+
+        Returns ``(response, refused)`` where ``refused`` maps the recipients
+        the server rejected to their ``(code, message)``.
+        """
         raise NotImplementedError
 
+    def close(self) -> None:
+        """Release any connection held by the backend."""
+
 
 class OutlookBackend(EmailBackend):
     def __init__(self, account_name: str | None = None):
@@ -152,12 +389,190 @@ class OutlookBackend(EmailBackend):
 
 
 
+class _SmtpSession:
+    """一條已登入的 SMTP 連線與其重用計數。"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+
+
 class SmtpBackend(EmailBackend):
-    def __init__(self, host: str, port: int, username: str, password: str):
+    """SMTP backend with a pool of authenticated sessions reused across sends.
+
+    Reused sessions are reset with RSET (which doubles as the liveness check),
+    retired after ``max_per_connection`` messages, and replaced after a 421
+    reply or a dropped socket.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        max_per_connection: int = SMTP_MAX_PER_CONNECTION,
+        metrics: "Metrics | None" = None,
+        starttls: bool = True,
+    ):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.max_per_connection = max(1, int(max_per_connection))
+        self._idle: list[_SmtpSession] = []
+        self._lock = threading.Lock()
+        self._skeleton = None
+        self._drafts = None
+        self.metrics = metrics or Metrics()
+        self.starttls = starttls
+
+    def _connect(self) -> _SmtpSession:
+        with self.metrics.time("connect"):
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            # DATA 是分成多段寫出的，關掉 Nagle 以免每封信都等對方的 delayed ACK
+            server.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.starttls:
+                with self.metrics.time("tls"):
+                    server.starttls()
+            with self.metrics.time("auth"):
+                server.login(self.username, self.password)
+        except BaseException:
+            server.close()
+            raise
+        return _SmtpSession(server)
+
+    def _acquire(self) -> _SmtpSession:
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return self._connect()
+            # RSET 清掉上一封的交易狀態，同時確認連線仍然存活
+            try:
+                code, _ = session.server.rset()
+            except (smtplib.SMTPException, OSError):
+                code = None
+            if code == 250:
+                return session
+            self._discard(session)
+
+    def _release(self, session: _SmtpSession) -> None:
+        if session.sent >= self.max_per_connection:
+            self._discard(session, polite=True)
+            return
+        with self._lock:
+            self._idle.append(session)
+
+    @staticmethod
+    def _discard(session: _SmtpSession, polite: bool = False) -> None:
+        try:
+            if polite:
+                session.server.quit()
+            else:
+                session.server.close()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _transaction(
+        self, server: smtplib.SMTP, recipients: list[str], data_chunks
+    ) -> tuple[str, dict]:
+        """Like ``smtplib.sendmail``, but streams the DATA chunks to the socket.
+
+        ``data_chunks`` are already dot-stuffed and end with CRLF.CRLF
+        (``MessageSkeleton.data_chunks``). Returns (server response, refused
+        recipients).
+        """
+        code, msg = server.mail(self.username)
+        if code != 250:
+            if code != 421:
+                self._reset(server)
+            raise smtplib.SMTPSenderRefused(code, msg, self.username)
+        refused = {}
+        for rcpt in recipients:
+            code, msg = server.rcpt(rcpt)
+            if code not in (250, 251):
+                refused[rcpt] = (code, msg)
+            if code == 421:
+                # 421 是伺服器要關閉連線而不是拒收，交給 _deliver 換新連線重寄
+                server.close()
+                raise smtplib.SMTPResponseException(code, msg)
+        if len(refused) == len(recipients):
+            self._reset(server)
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, msg = server.docmd("DATA")
+        if code != 354:
+            if code != 421:
+                self._reset(server)
+            raise smtplib.SMTPDataError(code, msg)
+        for chunk in data_chunks:
+            server.send(chunk)
+        code, msg = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, msg)
+        return f"{code} {msg.decode('utf-8', 'replace')}", refused
+
+    @staticmethod
+    def _reset(server: smtplib.SMTP) -> None:
+        try:
+            server.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    def _deliver(self, recipients: list[str], data_chunks) -> tuple[str, dict]:
+        """Send one message on a pooled session, reconnecting once on 421/drop.
+
+        Returns the server response and the recipients it refused.
+        """
+        for attempt in range(2):
+            session = self._acquire()
+            # SMTPException 是 OSError 的子類別，伺服器回覆錯誤要先攔下，不能當成斷線重寄
+            try:
+                with self.metrics.time("data"):
+                    result = self._transaction(
+                        session.server, recipients, data_chunks
+                    )
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code == 421:
+                    self._discard(session)
+                    if attempt:
+                        raise
+                    continue
+                self._release(session)
+                raise
+            except smtplib.SMTPRecipientsRefused:
+                self._release(session)
+                raise
+            except smtplib.SMTPServerDisconnected:
+                self._discard(session)
+                if attempt:
+                    raise
+                continue
+            except smtplib.SMTPException:
+                # 其他協定錯誤不是斷線，不重寄；交易狀態不明，這條連線也不再重用
+                self._discard(session)
+                raise
+            except OSError:
+                self._discard(session)
+                if attempt:
+                    raise
+                continue
+            session.sent += 1
+            self._release(session)
+            return result
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            drafts, self._drafts = self._drafts, None
+            skeleton, self._skeleton = self._skeleton, None
+        for session in idle:
+            self._discard(session, polite=True)
+        if drafts is not None:
+            drafts.close()
+        if skeleton is not None:
+            skeleton[1].close()
 
     def send(
         self,
@@ -167,112 +582,2291 @@ class SmtpBackend(EmailBackend):
         html_body: str,
         embedded_images: dict[str, Path],
         attachments: list[Path],
-    ) -> None:
+    ) -> str | None:
+        with self.metrics.time("mime"):
+            skeleton = self._get_skeleton(subject, embedded_images, attachments)
+            if mode == "draft":
+                chunks = skeleton.chunks(recipient, html_body)
+            else:
+                chunks = skeleton.data_chunks(recipient, html_body)
+
+        if mode == "draft":
+            with self.metrics.time("draft_write"):
+                self._get_draft_archive().append(chunks)
+            response = None
+        else:
+            response, _ = self._deliver([recipient], chunks)
+        self.metrics.add("message_bytes", sum(map(len, chunks)))
+        return response
+
+    def send_batch(
+        self,
+        mode: str,
+        recipients: list[str],
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> tuple[str | None, dict]:
+        # 同一份內容寄給所有人，To 不能列出其他收件人
+        with self.metrics.time("mime"):
+            skeleton = self._get_skeleton(subject, embedded_images, attachments)
+            chunks = skeleton.data_chunks(UNDISCLOSED_RECIPIENTS, html_body)
+        result = self._deliver(recipients, chunks)
+        self.metrics.add("message_bytes", sum(map(len, chunks)))
+        return result
+
+    def _get_draft_archive(self) -> "DraftArchive":
+        with self._lock:
+            if self._drafts is None:
+                draft_dir = get_base_dir() / "drafts"
+                draft_dir.mkdir(exist_ok=True)
+                name = time.strftime("drafts-%Y%m%d-%H%M%S.mbox")
+                self._drafts = DraftArchive(draft_dir / name, self.username)
+            return self._drafts
+
+    def _get_skeleton(
+        self,
+        subject: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> "MessageSkeleton":
+        key = (subject, tuple(embedded_images.items()), tuple(attachments))
+        with self._lock:
+            if self._skeleton is None or self._skeleton[0] != key:
+                skeleton = MessageSkeleton(
+                    self.username, subject, embedded_images, attachments
+                )
+                self._skeleton = (key, skeleton)
+            return self._skeleton[1]
+
+
+class _AsyncSmtpSession:
+    """一條 asyncio SMTP 連線：只實作寄信需要的 ESMTP 指令。"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.features: dict[str, str] = {}
+        self.sent = 0
+        self.broken = False
+
+    async def read_reply(self) -> tuple[int, bytes]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), SMTP_TIMEOUT)
+            if not line:
+                self.broken = True
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b"-":
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            self.broken = True
+            raise smtplib.SMTPServerDisconnected(f"Malformed reply: {line!r}")
+        return code, b"\n".join(lines)
+
+    async def command(self, line: bytes, expected: int) -> tuple[int, bytes]:
+        self.writer.write(line + b"\r\n")
+        await self.writer.drain()
+        code, msg = await self.read_reply()
+        if code != expected:
+            raise smtplib.SMTPResponseException(code, msg)
+        return code, msg
+
+    async def ehlo(self) -> None:
+        _, msg = await self.command(b"EHLO " + socket.getfqdn().encode(), 250)
+        self.features = {}
+        for line in msg.decode("ascii", "replace").splitlines()[1:]:
+            keyword, _, params = line.partition(" ")
+            self.features[keyword.lower()] = params
+
+    async def starttls(self, host: str) -> None:
+        import ssl
+
+        await self.command(b"STARTTLS", 220)
+        context = ssl.create_default_context()
+        if hasattr(self.writer, "start_tls"):
+            await self.writer.start_tls(context, server_hostname=host)
+        else:  # Python 3.10 的 StreamWriter 沒有 start_tls
+            loop = asyncio.get_running_loop()
+            transport = await loop.start_tls(
+                self.writer.transport,
+                self.writer.transport.get_protocol(),
+                context,
+                server_hostname=host,
+            )
+            self.writer._transport = transport
+            self.reader._transport = transport
+        await self.ehlo()
+
+    async def login(self, username: str, password: str) -> None:
+        if "auth" not in self.features:
+            raise smtplib.SMTPNotSupportedError(
+                "SMTP AUTH extension not supported by server."
+            )
+        methods = self.features["auth"].upper().split()
+        try:
+            if "PLAIN" in methods:
+                token = f"\0{username}\0{password}".encode()
+                await self.command(b"AUTH PLAIN " + base64.b64encode(token), 235)
+            else:
+                await self.command(b"AUTH LOGIN", 334)
+                await self.command(base64.b64encode(username.encode()), 334)
+                await self.command(base64.b64encode(password.encode()), 235)
+        except smtplib.SMTPResponseException as e:
+            raise smtplib.SMTPAuthenticationError(e.smtp_code, e.smtp_error)
+
+    async def transaction(
+        self, sender: str, recipients: list[str], data_chunks
+    ) -> tuple[str, dict]:
+        """MAIL/RCPT/DATA；伺服器支援 PIPELINING 時一次送出，只等一次往返。
+
+        ``data_chunks`` 已做 dot-stuffing 並以 CRLF.CRLF 結尾，分段寫入 socket。
+        回傳 (伺服器回應, 被拒絕的收件人)。
+        """
+        commands = [b"MAIL FROM:<%s>\r\n" % sender.encode()]
+        commands += [b"RCPT TO:<%s>\r\n" % r.encode() for r in recipients]
+        commands.append(b"DATA\r\n")
+        replies = []
+        if "pipelining" in self.features:
+            self.writer.write(b"".join(commands))
+            await self.writer.drain()
+            for _ in commands:
+                replies.append(await self.read_reply())
+        else:
+            for line in commands:
+                self.writer.write(line)
+                await self.writer.drain()
+                replies.append(await self.read_reply())
+
+        (mail_code, mail_msg), *rcpt_replies, (data_code, data_msg) = replies
+        for code, msg in rcpt_replies:
+            if code == 421:
+                # 伺服器要關閉連線，不是拒收：由 _deliver_async 換新連線重寄
+                self.broken = True
+                raise smtplib.SMTPResponseException(code, msg)
+        refused = {
+            rcpt: reply
+            for rcpt, reply in zip(recipients, rcpt_replies)
+            if reply[0] not in (250, 251)
+        }
+        accepted = mail_code == 250 and len(refused) < len(recipients)
+        if data_code == 354 and not accepted:
+            # 管線化時 DATA 可能已被接受；送出空內容結束這筆交易
+            self.writer.write(b".\r\n")
+            await self.writer.drain()
+            await self.read_reply()
+        if mail_code != 250:
+            await self.reset()
+            raise smtplib.SMTPSenderRefused(mail_code, mail_msg, sender)
+        if not accepted:
+            await self.reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if data_code != 354:
+            await self.reset()
+            raise smtplib.SMTPDataError(data_code, data_msg)
+
+        for chunk in data_chunks:
+            view = memoryview(chunk)
+            for start in range(0, len(view), SOCKET_WRITE_CHUNK):
+                self.writer.write(view[start:start + SOCKET_WRITE_CHUNK])
+                await self.writer.drain()
+        code, msg = await self.read_reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, msg)
+        return f"{code} {msg.decode('utf-8', 'replace')}", refused
+
+    async def reset(self) -> None:
+        try:
+            await self.command(b"RSET", 250)
+        except (smtplib.SMTPException, OSError, asyncio.TimeoutError):
+            self.broken = True
+
+    async def quit(self) -> None:
+        try:
+            await self.command(b"QUIT", 221)
+        except (smtplib.SMTPException, OSError, asyncio.TimeoutError):
+            pass
+        self.close()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class AsyncSmtpBackend(SmtpBackend):
+    """SMTP backend multiplexing up to ``max_sessions`` sessions on one asyncio loop.
+
+    The loop runs on its own thread and ``submit`` returns a future, so a
+    single dispatcher thread can keep many messages in flight without a
+    thread per connection. When the server offers PIPELINING, MAIL FROM,
+    every RCPT TO and DATA go out in one write: one round trip per message
+    instead of three or more. Pooling limits, retries and draft handling
+    match ``SmtpBackend``.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        max_per_connection: int = SMTP_MAX_PER_CONNECTION,
+        metrics: "Metrics | None" = None,
+        starttls: bool = True,
+        max_sessions: int = SEND_WORKERS,
+    ):
+        super().__init__(
+            host, port, username, password, max_per_connection, metrics, starttls
+        )
+        self.max_sessions = max(1, int(max_sessions))
+        self._sessions: list[_AsyncSmtpSession] = []  # 閒置中的連線，只在 loop 內存取
+        self._slots = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        mode: str,
+        recipient: str,
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ):
+        """排入一封信，回傳 concurrent.futures.Future（結果為 (伺服器回應, 被拒絕的收件人)）。"""
+        if mode == "draft":
+            future = futures.Future()
+            try:
+                future.set_result(
+                    (
+                        super().send(
+                            mode, recipient, subject, html_body, embedded_images, attachments
+                        ),
+                        {},
+                    )
+                )
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        return self._submit([recipient], recipient, subject, html_body, embedded_images, attachments)
+
+    def submit_batch(
+        self,
+        mode: str,
+        recipients: list[str],
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ):
+        """同一份內容寄給多位收件人的單筆交易；回傳同 submit。"""
+        return self._submit(
+            recipients, UNDISCLOSED_RECIPIENTS, subject, html_body, embedded_images, attachments
+        )
+
+    def _submit(self, recipients, to_header, subject, html_body, embedded_images, attachments):
+        with self.metrics.time("mime"):
+            skeleton = self._get_skeleton(subject, embedded_images, attachments)
+            data_chunks = skeleton.data_chunks(to_header, html_body)
+        return asyncio.run_coroutine_threadsafe(
+            self._deliver_async(recipients, data_chunks), self._loop
+        )
+
+    def send(
+        self,
+        mode: str,
+        recipient: str,
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> str | None:
+        return self.submit(
+            mode, recipient, subject, html_body, embedded_images, attachments
+        ).result()[0]
+
+    def send_batch(
+        self,
+        mode: str,
+        recipients: list[str],
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> tuple[str | None, dict]:
+        return self.submit_batch(
+            mode, recipients, subject, html_body, embedded_images, attachments
+        ).result()
+
+    async def _connect_async(self) -> _AsyncSmtpSession:
+        with self.metrics.time("connect"):
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), SMTP_TIMEOUT
+            )
+        session = _AsyncSmtpSession(reader, writer)
+        try:
+            code, msg = await session.read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, msg)
+            await session.ehlo()
+            if self.starttls:
+                with self.metrics.time("tls"):
+                    await session.starttls(self.host)
+            with self.metrics.time("auth"):
+                await session.login(self.username, self.password)
+        except BaseException:
+            session.close()
+            raise
+        return session
+
+    async def _acquire_async(self) -> _AsyncSmtpSession:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_sessions)
+        await self._slots.acquire()
+        if self._sessions:
+            return self._sessions.pop()
+        try:
+            return await self._connect_async()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release_async(self, session: _AsyncSmtpSession) -> None:
+        if session.broken:
+            session.close()
+        elif session.sent >= self.max_per_connection:
+            await session.quit()
+        else:
+            self._sessions.append(session)
+        self._slots.release()
+
+    async def _deliver_async(
+        self, recipients: list[str], data_chunks
+    ) -> tuple[str, dict]:
+        """在連線池的一條連線上寄出；遇到 421 或斷線時重連重試一次。"""
+        for attempt in range(2):
+            session = await self._acquire_async()
+            try:
+                with self.metrics.time("data"):
+                    result = await session.transaction(
+                        self.username, recipients, data_chunks
+                    )
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code == 421:
+                    session.broken = True
+                await self._release_async(session)
+                if e.smtp_code != 421 or attempt:
+                    raise
+                continue
+            except smtplib.SMTPRecipientsRefused:
+                await self._release_async(session)
+                raise
+            except smtplib.SMTPServerDisconnected:
+                session.broken = True
+                await self._release_async(session)
+                if attempt:
+                    raise
+                continue
+            except smtplib.SMTPException:
+                # 其他協定錯誤不是斷線，不重寄
+                session.broken = True
+                await self._release_async(session)
+                raise
+            except (OSError, asyncio.TimeoutError):
+                session.broken = True
+                await self._release_async(session)
+                if attempt:
+                    raise
+                continue
+            session.sent += 1
+            await self._release_async(session)
+            self.metrics.add("message_bytes", sum(map(len, data_chunks)))
+            return result
+
+    async def _close_async(self) -> None:
+        sessions, self._sessions = self._sessions, []
+        await asyncio.gather(*(session.quit() for session in sessions))
+
+    def close(self) -> None:
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_async(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+        super().close()
+
+
+class SendCancelled(Exception):
+    """等待可用帳號時被使用者取消。"""
+
+
+class _Account:
+    """ShardedBackend 中一個 SMTP 帳號（或轉送伺服器）的狀態。"""
+
+    def __init__(self, name, backend, weight, workers, per_hour, per_day, limiter):
+        self.name = name
+        self.backend = backend
+        self.weight = weight
+        self.workers = workers
+        self.per_hour = per_hour
+        self.per_day = per_day
+        self.limiter = limiter
+        self.current = 0  # smooth weighted round-robin 的目前權重
+        self.active = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.hour_times = deque()  # 最近一小時 / 一天的寄送時間（time.time()）
+        self.day_times = deque()
+
+    def quota_wait(self, now: float) -> float:
+        """還要等幾秒才能再寄一封（0 表示現在就可以）。"""
+        while self.hour_times and self.hour_times[0] <= now - 3600:
+            self.hour_times.popleft()
+        while self.day_times and self.day_times[0] <= now - 86400:
+            self.day_times.popleft()
+        wait = max(0.0, self.cooldown_until - now)
+        if self.per_hour and len(self.hour_times) >= self.per_hour:
+            wait = max(wait, self.hour_times[0] + 3600 - now)
+        if self.per_day and len(self.day_times) >= self.per_day:
+            wait = max(wait, self.day_times[0] + 86400 - now)
+        return wait
+
+
+def is_recipient_error(exc: Exception) -> bool:
+    """5xx 收件人或內容錯誤：換帳號重寄也不會成功。"""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused) and exc.recipients:
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPDataError) and exc.smtp_code >= 500
+
+
+class ShardedBackend(EmailBackend):
+    """Spreads a campaign over several SMTP accounts or relays.
+
+    Each account has its own session pool, concurrency (``workers``),
+    hourly/daily quota and rate limiter. Recipients are assigned by smooth
+    weighted round-robin among the accounts that have a free slot and quota
+    left. When an account is throttled, hits its quota, or fails with a
+    connection, auth or sender error, it cools down and the message fails
+    over to the next account. Quota usage is kept in ``state_path`` so
+    caps hold across runs.
+    """
+
+    def __init__(
+        self,
+        accounts: list[dict],
+        defaults: dict,
+        cancel_event,
+        logger,
+        state_path=None,
+        metrics: "Metrics | None" = None,
+    ):
+        self._cond = threading.Condition()
+        self._announced = False  # 「全部帳號都滿了」只提示一次
+        self._cancel_event = cancel_event
+        self._logger = logger
+        self._state_path = Path(state_path) if state_path else None
+        self.metrics = metrics or Metrics()
+        state = {}
+        if self._state_path is not None and self._state_path.exists():
+            try:
+                with open(self._state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to load quota state: {e}")
+
+        self.accounts: list[_Account] = []
+        for spec in accounts:
+            cfg = {**defaults, **spec}
+            backend = SmtpBackend(
+                cfg["host"],
+                int(cfg.get("port") or 0),
+                cfg["user"],
+                cfg.get("pass", cfg.get("password", "")),
+                max_per_connection=cfg["max_per_connection"],
+                metrics=self.metrics,
+                starttls=cfg.get("starttls", True),
+            )
+            name = cfg.get("name") or f"{cfg['user']}@{cfg['host']}"
+            account = _Account(
+                name,
+                backend,
+                weight=max(1, int(cfg.get("weight", 1))),
+                workers=max(1, int(cfg.get("workers", 1))),
+                per_hour=int(cfg.get("per_hour", 0)),
+                per_day=int(cfg.get("per_day", 0)),
+                limiter=RateLimiter(
+                    float(cfg["rate_per_second"]), float(cfg["rate_per_minute"])
+                ),
+            )
+            now = time.time()
+            for t in state.get(name, []):
+                if t > now - 86400:
+                    account.day_times.append(t)
+                    if t > now - 3600:
+                        account.hour_times.append(t)
+            self.accounts.append(account)
+        if not self.accounts:
+            raise ValueError("smtp_accounts 是空的")
+
+    @property
+    def workers(self) -> int:
+        return sum(account.workers for account in self.accounts)
+
+    def _checkout(self, tried):
+        """挑下一個可用的帳號並佔用一格配額，回傳 (帳號, 佔用時間)。
+
+        都不可用時等待；全部試過則回傳 (None, None)。
+        """
+        with self._cond:
+            while True:
+                if self._cancel_event.is_set():
+                    raise SendCancelled("使用者已取消")
+                now = time.time()
+                candidates = [a for a in self.accounts if a not in tried]
+                if not candidates:
+                    return None, None
+                ready = []
+                wait = 1.0
+                for account in candidates:
+                    quota_wait = account.quota_wait(now)
+                    if quota_wait > 0:
+                        wait = min(wait, quota_wait)
+                    elif account.active < account.workers:
+                        ready.append(account)
+                if ready:
+                    total = sum(a.weight for a in ready)
+                    for account in ready:
+                        account.current += account.weight
+                    chosen = max(ready, key=lambda a: a.current)
+                    chosen.current -= total
+                    chosen.active += 1
+                    # 先佔用配額，避免並行的執行緒一起超過上限
+                    chosen.hour_times.append(now)
+                    chosen.day_times.append(now)
+                    self._announced = False
+                    return chosen, now
+                if not self._announced and all(
+                    a.quota_wait(now) > 0 for a in candidates
+                ):
+                    soonest = min(a.quota_wait(now) for a in candidates)
+                    self._logger(
+                        f"⏳ 所有帳號都已達寄送上限或冷卻中，約 {format_duration(soonest)} 後繼續"
+                    )
+                    self._announced = True
+                self._cond.wait(wait)
+
+    def _checkin(self, account: _Account, unused=None, error=None) -> None:
+        """歸還連線名額；unused 是沒用到的配額佔用時間（沒寄出的信不算配額）。"""
+        with self._cond:
+            account.active -= 1
+            if unused is not None:
+                account.hour_times.remove(unused)
+                account.day_times.remove(unused)
+            if error is None:
+                account.failures = 0
+            else:
+                account.failures += 1
+                account.cooldown_until = time.time() + min(
+                    RATE_BACKOFF_MAX,
+                    RATE_BACKOFF_SECONDS * 2 ** (account.failures - 1),
+                )
+            self._cond.notify_all()
+
+    def send(
+        self,
+        mode: str,
+        recipient: str,
+        subject: str,
+        html_body: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ) -> str | None:
+        tried = set()
+        last_error = None
+        while True:
+            account, reserved = self._checkout(tried)
+            if account is None:
+                raise last_error
+            tried.add(account)
+            if not account.limiter.acquire(self._cancel_event):
+                self._checkin(account, unused=reserved)
+                raise SendCancelled("使用者已取消")
+            try:
+                response = account.backend.send(
+                    mode, recipient, subject, html_body, embedded_images, attachments
+                )
+            except Exception as e:
+                if is_recipient_error(e):
+                    self._checkin(account, unused=reserved)
+                    account.limiter.succeeded()
+                    raise
+                if is_throttling_error(e):
+                    account.limiter.throttled()
+                self._checkin(account, unused=reserved, error=e)
+                self._logger(f"🔀 帳號 {account.name} 寄送失敗，改用其他帳號：{e}")
+                last_error = e
+                continue
+            self._checkin(account)
+            account.limiter.succeeded()
+            return f"[{account.name}] {response or 'sent'}"
+
+    def close(self) -> None:
+        for account in self.accounts:
+            account.backend.close()
+        if self._state_path is None:
+            return
+        with self._cond:
+            state = {a.name: list(a.day_times) for a in self.accounts}
+        try:
+            self._state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._state_path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self._state_path)
+        except OSError as e:
+            logging.error(f"Failed to save quota state: {e}")
+
+
+# SMTP 需要 CRLF 換行；沿用 compat32 的標頭編碼方式
+SMTP_POLICY = email.policy.compat32.clone(linesep="\r\n")
+
+
+def flatten_part(part) -> bytes:
+    buf = io.BytesIO()
+    BytesGenerator(buf, mangle_from_=False, policy=SMTP_POLICY).flatten(part)
+    return buf.getvalue()
+
+
+class RenderedHtml(str):
+    """套版好的 HTML，附帶套版行程已編好的 MIME 分段（``mime_part``）。"""
+
+    def __new__(cls, html_body: str, mime_part: bytes):
+        self = super().__new__(cls, html_body)
+        self.mime_part = mime_part
+        return self
+
+
+def encode_html_part(html_body: str) -> bytes:
+    """把收件人專屬的 HTML 編成 MIME 分段（標頭＋base64 內容）。"""
+    if isinstance(html_body, RenderedHtml):
+        return html_body.mime_part
+    return flatten_part(MIMEText(html_body, "html", "utf-8"))
+
+
+def write_base64(src, dst) -> None:
+    """把檔案逐段編成每行 76 字元的 base64 寫入 dst，不整個讀進記憶體。"""
+    while True:
+        data = src.read(MIME_READ_CHUNK)
+        if not data:
+            break
+        encoded = base64.b64encode(data)
+        dst.write(
+            b"".join(
+                encoded[start:start + 76] + b"\r\n"
+                for start in range(0, len(encoded), 76)
+            )
+        )
+
+
+def dot_stuff_lines(data) -> bytes:
+    """行首的 "." 加倍（SMTP DATA 的 dot-stuffing）。"""
+    return re.sub(rb"(?m)^\.", b"..", data)
+
+
+def _spooled_part(maintype: str, subtype: str, path: Path, files: dict) -> MIMEBase:
+    """建立內容稍後才從檔案串流編碼的 base64 分段；內容先用唯一字串佔位。"""
+    part = MIMEBase(maintype, subtype)
+    part["Content-Transfer-Encoding"] = "base64"
+    token = uuid.uuid4().hex
+    part.set_payload(token)
+    files[token.encode()] = path
+    return part
+
+
+class MessageSkeleton:
+    """Run-level MIME message whose image and attachment parts are encoded once.
+
+    Images and attachments are read in chunks, base64-encoded incrementally
+    into an anonymous spool file and memory-mapped, so the encoded parts are
+    shared by every in-flight message instead of being copied per send.
+    ``chunks`` only encodes the personalized HTML part and the To header and
+    splices them between the cached segments.
+    """
+
+    def __init__(
+        self,
+        sender: str,
+        subject: str,
+        embedded_images: dict[str, Path],
+        attachments: list[Path],
+    ):
         msg_root = MIMEMultipart("related")
         msg_root["Subject"] = subject
-        msg_root["From"] = self.username
-        msg_root["To"] = recipient
+        msg_root["From"] = sender
         alt = MIMEMultipart("alternative")
-        alt.attach(MIMEText(html_body, "html", "utf-8"))
+        # 先放一個唯一內容的 HTML 分段當佔位，序列化後從這裡切開
+        placeholder = MIMEText(uuid.uuid4().hex, "html", "utf-8")
+        alt.attach(placeholder)
         msg_root.attach(alt)
 
+        files = {}
         for cid, path in embedded_images.items():
-            with open(path, "rb") as f:
-                data = f.read()
             mime_type, _ = mimetypes.guess_type(path)
             if mime_type and mime_type.startswith("image/"):
                 _, subtype = mime_type.split("/", 1)
             else:
                 subtype = path.suffix.lstrip(".") or "png"
-            img = MIMEImage(data, _subtype=subtype)
+            img = _spooled_part("image", subtype, path, files)
             img.add_header("Content-ID", f"<{cid}>")
             msg_root.attach(img)
 
         for file_path in attachments:
-            with open(file_path, "rb") as f:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(f.read())
-            encoders.encode_base64(part)
+            part = _spooled_part("application", "octet-stream", file_path, files)
             part.add_header(
                 "Content-Disposition", "attachment", filename=file_path.name
             )
             msg_root.attach(part)
 
-        if mode == "draft":
-            draft_dir = get_base_dir() / "drafts"
-            draft_dir.mkdir(exist_ok=True)
-            with open(draft_dir / f"{recipient}.eml", "w", encoding="utf-8") as f:
-                f.write(msg_root.as_string())
+        data = flatten_part(msg_root)
+        head, body = data.split(b"\r\n\r\n", 1)
+        before, after = body.split(flatten_part(placeholder))
+        self.head = head + b"\r\n"
+        self.before_html = b"\r\n" + before
+
+        # 圖片與附件（都在 HTML 分段之後）寫進暫存檔，再以 mmap 唯讀共用
+        self._spool = tempfile.TemporaryFile()
+        pos = 0
+        if files:
+            pattern = re.compile(b"|".join(map(re.escape, files)))
+            for match in pattern.finditer(after):
+                self._spool.write(after[pos:match.start()])
+                with open(files[match.group()], "rb") as f:
+                    write_base64(f, self._spool)
+                pos = match.end()
+        self._spool.write(after[pos:])
+        self._spool.flush()
+        self._map = mmap.mmap(self._spool.fileno(), 0, access=mmap.ACCESS_READ)
+        self.after_html = memoryview(self._map)
+
+        # 每個片段都從行首開始，可分別做 dot-stuffing；
+        # 產生的內容不會有以 "." 開頭的行，通常不需複製
+        self._head_data = dot_stuff_lines(self.head)
+        self._before_data = dot_stuff_lines(self.before_html)
+        if self._map.find(b"\n.") == -1:
+            self._after_data = self.after_html
+        else:
+            self._after_data = dot_stuff_lines(self.after_html)
+        self._end_data = b".\r\n" if after.endswith(b"\r\n") else b"\r\n.\r\n"
+
+    def chunks(self, recipient: str, html_body: str) -> tuple:
+        """依序組成整封信的位元組片段（不複製快取的圖片與附件）。"""
+        return (
+            self.head,
+            SMTP_POLICY.fold_binary("To", recipient),
+            self.before_html,
+            encode_html_part(html_body),
+            self.after_html,
+        )
+
+    def data_chunks(self, recipient: str, html_body: str) -> tuple:
+        """SMTP DATA 要送出的片段：已做 dot-stuffing，並以 CRLF.CRLF 結尾。"""
+        return (
+            self._head_data,
+            dot_stuff_lines(SMTP_POLICY.fold_binary("To", recipient)),
+            self._before_data,
+            dot_stuff_lines(encode_html_part(html_body)),
+            self._after_data,
+            self._end_data,
+        )
+
+    def close(self) -> None:
+        try:
+            self.after_html.release()
+            self._map.close()
+        except BufferError:  # 還有片段在使用中，交給 GC 回收
+            return
+        self._spool.close()
+
+
+class DraftArchive:
+    """Append-only mbox holding every SMTP draft of a run.
+
+    Messages are written chunk by chunk straight to the file and fsync'ed in
+    batches of ``DRAFT_FSYNC_EVERY`` (and on close). No line of a generated
+    message starts with "From " (headers, boundaries and base64 only), so no
+    mbox quoting is needed.
+    """
+
+    def __init__(self, path, sender: str):
+        self.path = Path(path)
+        self._file = open(self.path, "ab")
+        self._lock = threading.Lock()
+        self._sender = (sender or "MAILER-DAEMON").encode("ascii", "replace")
+        self._unsynced = 0
+        self.count = 0
+
+    def append(self, chunks) -> None:
+        with self._lock:
+            f = self._file
+            f.write(b"From %s %s\n" % (self._sender, time.asctime().encode()))
+            for chunk in chunks:
+                f.write(chunk)
+            f.write(b"\n")
+            self.count += 1
+            self._unsynced += 1
+            if self._unsynced >= DRAFT_FSYNC_EVERY:
+                self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+# ─────────────────────────────
+# ⏱️ Rate Limiting
+# ─────────────────────────────
+
+
+class RateLimiter:
+    """Per-second and per-minute token buckets with throttling backoff.
+
+    After a quiet period the rate restarts at ``RATE_RAMP_START`` of the limit
+    and climbs back with each success; a 4xx throttling reply halves it and
+    blocks all senders for an exponentially growing backoff.
+    """
+
+    def __init__(self, per_second: float, per_minute: float):
+        self._lock = threading.Lock()
+        # [容量, 每秒補充量, 目前 token]；上限 ≤ 0 表示不限速，不建立該桶
+        self._buckets = [
+            [float(rate), float(rate) / period, float(rate)]
+            for rate, period in ((per_second, 1), (per_minute, 60))
+            if float(rate) > 0
+        ]
+        self._factor = RATE_RAMP_START
+        self._backoff = 0.0
+        self._blocked_until = 0.0
+        self._last = None
+
+    def _refill(self, now: float) -> None:
+        if self._last is None or now - self._last > RATE_QUIET_SECONDS:
+            self._factor = RATE_RAMP_START
+            for bucket in self._buckets:
+                bucket[2] = min(bucket[2], 1.0)
+        else:
+            elapsed = now - self._last
+            for bucket in self._buckets:
+                bucket[2] = min(
+                    bucket[0], bucket[2] + elapsed * bucket[1] * self._factor
+                )
+        self._last = now
+
+    def acquire(self, cancel_event) -> bool:
+        """等到可以寄出下一封；若等待期間被取消則回傳 False。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                for _, rate, tokens in self._buckets:
+                    if tokens < 1:
+                        wait = max(wait, (1 - tokens) / (rate * self._factor))
+                if wait <= 0:
+                    for bucket in self._buckets:
+                        bucket[2] -= 1
+                    return True
+            if cancel_event.wait(wait):
+                return False
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._factor = min(1.0, self._factor + RATE_RAMP_STEP)
+            self._backoff = 0.0
+
+    def throttled(self) -> None:
+        with self._lock:
+            self._factor = max(RATE_RAMP_START / 4, self._factor / 2)
+            self._backoff = min(
+                RATE_BACKOFF_MAX, self._backoff * 2 or RATE_BACKOFF_SECONDS
+            )
+            self._blocked_until = time.monotonic() + self._backoff
+
+
+def is_throttling_error(exc: Exception) -> bool:
+    """伺服器回覆 4xx（421/450/451/452…）視為節流，需要退避。"""
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPRecipientsRefused) and exc.recipients:
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    return False
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """暫時性錯誤（4xx、斷線、逾時）稍後重寄可能會成功；5xx 等永久錯誤則不會。"""
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return is_throttling_error(exc)
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPException):  # SMTPException 也是 OSError
+        return False
+    return isinstance(exc, (OSError, asyncio.TimeoutError))
+
+
+def retry_delay(attempt: int, base: float) -> float:
+    """第 attempt 次重試前等待的秒數：指數退避，再取後半段隨機抖動。"""
+    delay = min(RETRY_MAX_SECONDS, float(base) * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryQueue:
+    """Deferred retries ordered by due time, plus a count of in-flight messages.
+
+    The producer enqueues due retries between fresh rows, so retries never
+    hold up the main flow. Once the list is exhausted it keeps draining until
+    nothing is in flight (and could still fail) or waiting for a retry.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()  # 同一時間到期時維持先進先出
+        self._cond = threading.Condition()
+        self.in_flight = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def started(self, count: int = 1) -> None:
+        with self._cond:
+            self.in_flight += count
+
+    def settled(self, count: int = 1) -> None:
+        with self._cond:
+            self.in_flight -= count
+            self._cond.notify_all()
+
+    def push(self, delay: float, item) -> None:
+        with self._cond:
+            heapq.heappush(
+                self._heap, (time.monotonic() + delay, next(self._counter), item)
+            )
+            self._cond.notify_all()
+
+    def pop_due(self) -> list:
+        if not self._heap:
+            return []
+        now = time.monotonic()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def drain(self) -> list:
+        """取出所有還沒到期的重試（例如取消時）。"""
+        with self._cond:
+            items = [entry[2] for entry in sorted(self._heap)]
+            self._heap.clear()
+        return items
+
+    def wait(self, timeout: float) -> bool:
+        """等到下一筆重試到期或有信寄完（最多 timeout 秒）；全部結束時回傳 False。"""
+        with self._cond:
+            if not self._heap and self.in_flight <= 0:
+                return False
+            if self._heap:
+                timeout = min(timeout, max(0.0, self._heap[0][0] - time.monotonic()))
+            self._cond.wait(timeout)
+            return True
+
+
+# ─────────────────────────────
+# 📊 Metrics
+# ─────────────────────────────
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)  # 最後一格是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """以直方圖估計分位數（回傳所在區間的上界）。"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(METRICS_BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _PhaseTimer:
+    __slots__ = ("_metrics", "_phase", "_start")
+
+    def __init__(self, metrics, phase):
+        self._metrics = metrics
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._phase, time.perf_counter() - self._start)
+
+
+class Metrics:
+    """Per-phase timing histograms and byte counters for one run.
+
+    Phases: ``load`` (opening the list, exclusions and template), ``read``
+    (one recipient row), ``render``, ``mime``, ``connect``/``tls``/``auth``,
+    ``data`` (the SMTP transaction), ``draft_write``, ``send`` (the whole
+    backend call) and ``throttle`` (waiting on the rate limiter). Recording
+    a sample is a bisect and a few additions under a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: dict[str, _Histogram] = {}
+        self._counters: dict[str, int] = {}
+        self.started = time.time()
+
+    def time(self, phase: str) -> _PhaseTimer:
+        """with metrics.time("render"): ... 量測區塊耗時。"""
+        return _PhaseTimer(self, phase)
+
+    def observe(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._phases.get(phase)
+            if hist is None:
+                hist = self._phases[phase] = _Histogram()
+            hist.observe(seconds)
+
+    def add(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            phases = {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "mean": h.sum / h.count,
+                    "min": h.min,
+                    "max": h.max,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                    "buckets": dict(zip([*map(str, METRICS_BUCKETS), "+Inf"], h.counts)),
+                }
+                for name, h in self._phases.items()
+            }
+            counters = dict(self._counters)
+        return {
+            "started": self.started,
+            "elapsed": time.time() - self.started,
+            "phases": phases,
+            "counters": counters,
+        }
+
+    def to_prometheus(self) -> str:
+        """輸出 Prometheus textfile collector 格式。"""
+        snap = self.snapshot()
+        lines = [
+            "# HELP automailer_phase_seconds Time spent per send phase.",
+            "# TYPE automailer_phase_seconds histogram",
+        ]
+        for phase, data in sorted(snap["phases"].items()):
+            cumulative = 0
+            for le, n in data["buckets"].items():
+                cumulative += n
+                lines.append(
+                    f'automailer_phase_seconds_bucket{{phase="{phase}",le="{le}"}} {cumulative}'
+                )
+            lines.append(f'automailer_phase_seconds_sum{{phase="{phase}"}} {data["sum"]:.6f}')
+            lines.append(f'automailer_phase_seconds_count{{phase="{phase}"}} {data["count"]}')
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE automailer_{name}_total counter")
+            lines.append(f"automailer_{name}_total {value}")
+        lines.append("# TYPE automailer_run_started_seconds gauge")
+        lines.append(f"automailer_run_started_seconds {snap['started']:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory) -> None:
+        """寫出 metrics.json 與 automailer.prom（先寫暫存檔再取代，讀取端不會讀到半份）。"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        outputs = {
+            "metrics.json": json.dumps(self.snapshot(), indent=2),
+            "automailer.prom": self.to_prometheus(),
+        }
+        for name, text in outputs.items():
+            tmp = directory / (name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, directory / name)
+
+    def export_every(self, directory, interval: float, stop_event) -> threading.Thread:
+        """在背景每 interval 秒輸出一次，直到 stop_event 被設定。"""
+
+        def loop():
+            while not stop_event.wait(interval):
+                try:
+                    self.export(directory)
+                except OSError as e:
+                    logging.error(f"Failed to export metrics: {e}")
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+
+# ─────────────────────────────
+# 📂 Utils
+# ─────────────────────────────
+
+def get_excel_sheets(file_path: str) -> list[str]:
+    """取得 Excel 檔案的所有工作表名稱。若非 Excel 則回傳空清單。"""
+    ext = Path(file_path).suffix.lower()
+    try:
+        if ext == ".xlsx":
+            # 只讀 workbook.xml，不必載入整本活頁簿
+            with XlsxReader(file_path) as reader:
+                return reader.sheet_names
+        if ext == ".xls":
+            return pd.ExcelFile(file_path).sheet_names
+    except Exception:
+        return []
+    return []
+
+
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# Excel 內建的日期/時間數值格式代碼
+XLSX_DATE_FORMAT_IDS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+XLSX_EPOCH = datetime(1899, 12, 30)
+CSV_COUNT_CHUNK = 1 << 20
+SUPPRESSION_INITIAL_SLOTS = 1 << 16  # 必須是 2 的次方
+SUPPRESSION_MAX_LOAD = 0.7
+BLOOM_HASHES = 6
+JOURNAL_BATCH = 500
+JOURNAL_FLUSH_SECONDS = 2.0
+
+
+class XlsxReader:
+    """Streaming .xlsx reader yielding cell values and row visibility.
+
+    Sheets are parsed with ``iterparse`` one ``<row>`` at a time, so memory
+    stays flat regardless of sheet size (only the shared-string table is
+    held in memory).
+    """
+
+    def __init__(self, path):
+        try:
+            self._zip = zipfile.ZipFile(path)
+            self.sheets = self._read_sheet_paths()
+        except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+            raise ValueError(f"無法讀取 Excel 檔案 {path}: {e}") from e
+        self._shared = None
+        self._date_styles = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @property
+    def sheet_names(self) -> list[str]:
+        return list(self.sheets)
+
+    def _read_sheet_paths(self) -> dict[str, str]:
+        rels = {}
+        root = ET.fromstring(self._zip.read("xl/_rels/workbook.xml.rels"))
+        for rel in root.iter(f"{PKG_REL_NS}Relationship"):
+            target = rel.get("Target")
+            rels[rel.get("Id")] = (
+                target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            )
+        workbook = ET.fromstring(self._zip.read("xl/workbook.xml"))
+        return {
+            sheet.get("name"): rels[sheet.get(f"{XLSX_REL_NS}id")]
+            for sheet in workbook.iter(f"{XLSX_NS}sheet")
+        }
+
+    def _shared_strings(self) -> list[str]:
+        if self._shared is None:
+            self._shared = []
+            if "xl/sharedStrings.xml" in self._zip.namelist():
+                with self._zip.open("xl/sharedStrings.xml") as f:
+                    for _, elem in ET.iterparse(f):
+                        if elem.tag == f"{XLSX_NS}si":
+                            # 略過 <rPh> 注音標示，只取本文與 rich text 片段
+                            self._shared.append(
+                                "".join(
+                                    t.text or ""
+                                    for child in elem
+                                    if child.tag in (f"{XLSX_NS}t", f"{XLSX_NS}r")
+                                    for t in child.iter(f"{XLSX_NS}t")
+                                )
+                            )
+                            elem.clear()
+        return self._shared
+
+    def _date_style_ids(self) -> set[int]:
+        if self._date_styles is None:
+            self._date_styles = set()
+            if "xl/styles.xml" in self._zip.namelist():
+                root = ET.fromstring(self._zip.read("xl/styles.xml"))
+                date_formats = set(XLSX_DATE_FORMAT_IDS)
+                for fmt in root.iter(f"{XLSX_NS}numFmt"):
+                    # 去掉引號字串與 [色彩] 等區段後，含 y/d/h/s 即視為日期時間格式
+                    code = re.sub(r'"[^"]*"|\[[^\]]*\]', "", fmt.get("formatCode", ""))
+                    if re.search(r"[ydhs]", code, re.IGNORECASE):
+                        date_formats.add(int(fmt.get("numFmtId")))
+                cell_xfs = root.find(f"{XLSX_NS}cellXfs")
+                if cell_xfs is not None:
+                    for idx, xf in enumerate(cell_xfs.iter(f"{XLSX_NS}xf")):
+                        if int(xf.get("numFmtId", 0)) in date_formats:
+                            self._date_styles.add(idx)
+        return self._date_styles
+
+    def dimension_rows(self, sheet: str) -> int:
+        """由 <dimension> 標記估計工作表列數（含標題列），不必掃過整張表。"""
+        with self._zip.open(self.sheets[sheet]) as f:
+            for _, elem in ET.iterparse(f, events=("start",)):
+                if elem.tag == f"{XLSX_NS}dimension":
+                    rows = re.findall(r"\d+", elem.get("ref", ""))
+                    if not rows:
+                        return 0
+                    return int(rows[-1]) - int(rows[0]) + 1
+                if elem.tag == f"{XLSX_NS}sheetData":
+                    break
+        return 0
+
+    def iter_rows(self, sheet: str):
+        """逐列產生 (列號, 是否隱藏, 值的 list)；空白欄位為 None。"""
+        shared = self._shared_strings()
+        date_styles = self._date_style_ids()
+        row_tag, cell_tag = f"{XLSX_NS}row", f"{XLSX_NS}c"
+        value_tag, text_tag = f"{XLSX_NS}v", f"{XLSX_NS}t"
+        sheet_data = None
+        row_number = 0
+        with self._zip.open(self.sheets[sheet]) as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == f"{XLSX_NS}sheetData":
+                        sheet_data = elem
+                    continue
+                if elem.tag != row_tag:
+                    continue
+                row_number = int(elem.get("r") or row_number + 1)
+                hidden = elem.get("hidden") in ("1", "true")
+                values = []
+                for cell in elem.iter(cell_tag):
+                    ref = cell.get("r")
+                    col = column_index(ref) if ref else len(values)
+                    if col >= len(values):
+                        values.extend([None] * (col + 1 - len(values)))
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(t.text or "" for t in cell.iter(text_tag))
+                    else:
+                        v = cell.find(value_tag)
+                        text = v.text if v is not None else None
+                        if text is None:
+                            value = None
+                        elif kind == "s":
+                            value = shared[int(text)]
+                        elif kind == "b":
+                            value = text == "1"
+                        elif kind in ("str", "e"):
+                            value = text
+                        elif kind == "d":
+                            # ISO 8601 日期（openpyxl 的 iso_dates=True）；與舊版一樣回傳不帶時區的 datetime
+                            value = datetime.fromisoformat(text.removesuffix("Z"))
+                        else:
+                            value = float(text)
+                            if int(cell.get("s", 0)) in date_styles:
+                                value = XLSX_EPOCH + timedelta(days=value)
+                            elif value.is_integer():
+                                value = int(value)
+                    values[col] = value
+                yield row_number, hidden, values
+                # 處理完就丟掉，避免整張表的元素樹留在記憶體
+                sheet_data.clear()
+
+
+def column_index(ref: str) -> int:
+    """把儲存格位址（例如 "AB12"）的欄字母轉成 0 起算的欄索引。"""
+    idx = 0
+    for ch in ref:
+        if ch.isdigit():
+            break
+        idx = idx * 26 + (ord(ch.upper()) - 64)
+    return idx - 1
+
+
+class RecipientStream:
+    """Recipient rows read lazily from disk as tuples ordered like ``columns``.
+
+    ``estimated_total`` is a cheap upper-bound row count (hidden rows are not
+    known until they are read) used only for progress display. It is exact
+    for a ``RecipientCache`` hit and for one sheet of a ``WorkbookIndex``;
+    across ALL_SHEETS it still counts rows that end up blank once mapped onto
+    the first sheet's columns.
+    """
+
+    def __init__(self, columns: list[str], rows, estimated_total: int):
+        self.columns = columns
+        self.estimated_total = estimated_total
+        self._rows = rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+_PLAIN_CELL_TYPES = (str, int, float, bool, type(None))
+
+
+def _plain_cell(value):
+    """轉成 marshal 能存的值；日期時間存成 (ISO 字串,) 以便讀回時還原。"""
+    if type(value) in _PLAIN_CELL_TYPES:
+        return value
+    if value != value:  # NaN / NaT
+        return None
+    if isinstance(value, datetime):
+        return (datetime.isoformat(value),)
+    if hasattr(value, "item"):  # numpy 純量
+        return _plain_cell(value.item())
+    for kind in (bool, int, float, str):
+        if isinstance(value, kind):
+            return kind(value)
+    return str(value)
+
+
+def _write_row_block(f, block) -> None:
+    """把一批列以欄為單位寫成一個 marshal 區塊。"""
+    columns = [list(col) for col in zip(*block)]
+    date_columns = []
+    for c, col in enumerate(columns):
+        if not all(type(v) in _PLAIN_CELL_TYPES for v in col):
+            columns[c] = col = [_plain_cell(v) for v in col]
+            if any(type(v) is tuple for v in col):
+                date_columns.append(c)
+    marshal.dump((columns, date_columns), f)
+
+
+def _read_row_blocks(f):
+    """逐列讀回 _write_row_block 寫入的區塊，讀到結尾的 None 為止。"""
+    while (block := marshal.load(f)) is not None:
+        columns, date_columns = block
+        for c in date_columns:
+            columns[c] = [
+                datetime.fromisoformat(v[0]) if type(v) is tuple else v
+                for v in columns[c]
+            ]
+        yield from zip(*columns)
+
+
+class RecipientCache:
+    """On-disk cache of a parsed .xls recipient table.
+
+    The file name is keyed by the source path, sheet choice and
+    ``visible_only``; the source size and mtime are stored inside, so a
+    changed workbook is simply parsed again. Rows are stored column-wise in
+    marshal blocks of ``RECIPIENT_CACHE_BLOCK`` rows, so reading the cache
+    keeps memory flat just like streaming the workbook. The cache is written
+    while the workbook is being streamed and only kept once every row has
+    been read. (.xlsx files use ``WorkbookIndex`` instead.)
+    """
+
+    HEADER = struct.Struct("<4sIQ")  # magic, 版本, 列數
+    MAGIC = b"AMRC"
+
+    def __init__(self, file_path, visible_only, sheet_name):
+        source = Path(file_path).resolve()
+        stat = source.stat()
+        key = json.dumps([str(source), sheet_name, bool(visible_only)], ensure_ascii=False)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        self.path = get_base_dir() / RECIPIENT_CACHE_DIR / f"{digest}.bin"
+        self.source = [stat.st_size, stat.st_mtime_ns]
+
+    def load(self) -> RecipientStream | None:
+        """快取有效時回傳從快取串流的 RecipientStream，否則回傳 None。"""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        try:
+            magic, version, total = self.HEADER.unpack(f.read(self.HEADER.size))
+            meta = marshal.load(f)
+            valid = (
+                magic == self.MAGIC
+                and version == RECIPIENT_CACHE_VERSION
+                and meta["source"] == self.source
+            )
+        except (struct.error, EOFError, ValueError, TypeError, KeyError):
+            valid = False
+        if not valid:
+            f.close()
+            return None
+
+        def rows():
+            with f:
+                yield from _read_row_blocks(f)
+
+        return RecipientStream(meta["columns"], rows(), total)
+
+    def record(self, stream: RecipientStream) -> RecipientStream:
+        """包裝剛從活頁簿串流的名單：邊讀邊寫快取，全部讀完才換上正式檔名。"""
+        return RecipientStream(
+            stream.columns, self._tee(stream, stream.columns), stream.estimated_total
+        )
+
+    def _tee(self, rows, columns):
+        tmp = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.tmp")
+        f = None
+        try:
+            tmp.parent.mkdir(parents=True, exist_ok=True)
+            f = open(tmp, "wb")
+            f.write(self.HEADER.pack(self.MAGIC, RECIPIENT_CACHE_VERSION, 0))
+            marshal.dump({"source": self.source, "columns": list(columns)}, f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to cache recipients: {e}")
+            if f is not None:
+                f.close()
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+            yield from rows
             return
 
-        with smtplib.SMTP(self.host, self.port) as server:
-            server.starttls()
-            server.login(self.username, self.password)
-            server.sendmail(self.username, [recipient], msg_root.as_string())
+        count = 0
+        block = []
+        complete = False
+
+        def flush():
+            nonlocal f, count
+            try:
+                _write_row_block(f, block)
+                count += len(block)
+            except (OSError, ValueError) as e:
+                # 寫快取失敗不影響寄送：放棄這份快取，剩下的列照常產生
+                logging.error(f"Failed to cache recipients: {e}")
+                f.close()
+                f = None
+            block.clear()
 
+        try:
+            for row in rows:
+                yield row
+                if f is not None:
+                    block.append(row)
+                    if len(block) >= RECIPIENT_CACHE_BLOCK:
+                        flush()
+            if f is not None and block:
+                flush()
+            if f is not None:
+                marshal.dump(None, f)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, RECIPIENT_CACHE_VERSION, count))
+                f.close()
+                os.replace(tmp, self.path)
+                complete = True
+        except OSError as e:
+            logging.error(f"Failed to cache recipients: {e}")
+        finally:
+            # 沒讀完（例如中途取消）或寫入失敗的快取不能留下
+            if f is not None:
+                f.close()
+            if not complete:
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
 
-# ─────────────────────────────
-# 📂 Utils
-# ─────────────────────────────
 
-def get_excel_sheets(file_path: str) -> list[str]:
-    """取得 Excel 檔案的所有工作表名稱。若非 Excel 則回傳空清單。"""
-    if Path(file_path).suffix.lower() in [".xls", ".xlsx"]:
+class WorkbookIndex:
+    """Index of an .xlsx workbook built in one streaming pass over every sheet.
+
+    For each sheet it records the header, the number of non-blank data rows,
+    a hidden-row bitmap, the ranges of visible rows and the byte offset of
+    the sheet's rows, which are stored column-wise like ``RecipientCache``.
+    The sheet menu and ``iter_recipients`` share the index, so the workbook
+    XML is parsed once per file version whatever sheet or ``visible_only``
+    is chosen later. It lives in ``WORKBOOK_INDEX_DIR`` and is rebuilt when
+    the file's size or mtime changes.
+    """
+
+    HEADER = struct.Struct("<4sIQ")  # magic, 版本, 中繼資料的位移
+    MAGIC = b"AMWI"
+    _lock = threading.Lock()
+    _loaded = {}  # 索引檔路徑 → 已載入的 WorkbookIndex
+
+    def __init__(self, path, source, sheets):
+        self.path = path
+        self.source = source
+        self.sheets = sheets  # 工作表名稱 → {columns, rows, hidden, visible, offset}
+
+    @property
+    def sheet_names(self) -> list[str]:
+        return list(self.sheets)
+
+    @staticmethod
+    def _locate(file_path):
+        source_path = Path(file_path).resolve()
+        stat = source_path.stat()
+        digest = hashlib.sha1(str(source_path).encode("utf-8")).hexdigest()
+        index_path = get_base_dir() / WORKBOOK_INDEX_DIR / f"{digest}.bin"
+        return source_path, index_path, [stat.st_size, stat.st_mtime_ns]
+
+    @classmethod
+    def open(cls, file_path) -> "WorkbookIndex | None":
+        """讀取（必要時建立）活頁簿索引；索引寫不進快取資料夾時回傳 None。"""
+        source_path, index_path, source = cls._locate(file_path)
+        # 同一時間只讓一個執行緒建索引，其他人等它建好直接沿用
+        with cls._lock:
+            index = cls._loaded.get(index_path)
+            if index is None or index.source != source:
+                index = cls._load(index_path, source) or cls._build(
+                    source_path, index_path, source
+                )
+                if index is not None:
+                    cls._loaded[index_path] = index
+        return index
+
+    @classmethod
+    def _load(cls, index_path, source):
         try:
-            wb = load_workbook(file_path, read_only=True)
-            return wb.sheetnames
-        except Exception:
-            return []
-    return []
+            with open(index_path, "rb") as f:
+                magic, version, meta_offset = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                if magic != cls.MAGIC or version != WORKBOOK_INDEX_VERSION:
+                    return None
+                f.seek(meta_offset)
+                meta = marshal.load(f)
+        except (OSError, struct.error, EOFError, ValueError, TypeError):
+            return None
+        if meta.get("source") != source:
+            return None
+        return cls(index_path, source, dict(meta["sheets"]))
+
+    @classmethod
+    def _build(cls, source_path, index_path, source):
+        tmp = index_path.with_name(f"{index_path.name}.{uuid.uuid4().hex}.tmp")
+        sheets = {}
+        with XlsxReader(source_path) as reader:
+            try:
+                index_path.parent.mkdir(parents=True, exist_ok=True)
+                f = open(tmp, "wb")
+            except OSError as e:
+                logging.error(f"Failed to index workbook: {e}")
+                return None
+            try:
+                with f:
+                    f.write(cls.HEADER.pack(cls.MAGIC, WORKBOOK_INDEX_VERSION, 0))
+                    for name in reader.sheet_names:
+                        sheets[name] = cls._index_sheet(f, reader.iter_rows(name))
+                    meta_offset = f.tell()
+                    marshal.dump({"source": source, "sheets": list(sheets.items())}, f)
+                    f.seek(0)
+                    f.write(cls.HEADER.pack(cls.MAGIC, WORKBOOK_INDEX_VERSION, meta_offset))
+                os.replace(tmp, index_path)
+            except OSError as e:
+                logging.error(f"Failed to index workbook: {e}")
+                return None
+            finally:
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass
+        return cls(index_path, source, sheets)
+
+    @staticmethod
+    def _index_sheet(f, rows) -> dict:
+        _, _, header = next(rows, (0, False, []))
+        columns = [cell_text(h).strip() for h in header]
+        width = len(columns)
+        offset = f.tell()
+        hidden = bytearray()
+        visible = []  # [起, 迄) 的可見列區段，以非空白資料列計
+        count = 0
+        block = []
+        for _, is_hidden, values in rows:
+            row = tuple((values + [None] * width)[:width])
+            if not any(cell_text(v) for v in row):
+                continue
+            if count % 8 == 0:
+                hidden.append(0)
+            if is_hidden:
+                hidden[-1] |= 1 << (count % 8)
+            elif visible and visible[-1][1] == count:
+                visible[-1][1] = count + 1
+            else:
+                visible.append([count, count + 1])
+            count += 1
+            block.append(row)
+            if len(block) >= RECIPIENT_CACHE_BLOCK:
+                _write_row_block(f, block)
+                block = []
+        if block:
+            _write_row_block(f, block)
+        marshal.dump(None, f)
+        return {
+            "columns": columns,
+            "rows": count,
+            "hidden": bytes(hidden),
+            "visible": visible,
+            "offset": offset,
+        }
+
+    def hidden_rows(self, sheet: str) -> int:
+        return int.from_bytes(self.sheets[sheet]["hidden"], "little").bit_count()
+
+    def describe(self, sheet: str) -> str:
+        """工作表選單上顯示的列數說明。"""
+        hidden = self.hidden_rows(sheet)
+        text = f"{self.sheets[sheet]['rows'] - hidden:,} 列"
+        return f"{text}，隱藏 {hidden:,} 列" if hidden else text
+
+    def _selected(self, sheet_name) -> list[str]:
+        if sheet_name == ALL_SHEETS:
+            return self.sheet_names
+        name = sheet_name or self.sheet_names[0]
+        if name not in self.sheets:
+            raise ValueError(f"找不到工作表：{name}")
+        return [name]
+
+    def row_count(self, sheet_name, visible_only) -> int:
+        """選取範圍的資料列數。
+
+        單一工作表時是確切值；ALL_SHEETS 時是上限，只在第一張表沒有的欄位有值的列也會算進去。
+        """
+        return sum(
+            self.sheets[name]["rows"] - (self.hidden_rows(name) if visible_only else 0)
+            for name in self._selected(sheet_name)
+        )
+
+    def stream(self, sheet_name, visible_only) -> RecipientStream:
+        """從索引串流讀出名單，結果與直接讀活頁簿相同。"""
+        names = self._selected(sheet_name)
+        columns = self.sheets[names[0]]["columns"]
+        width = len(columns)
+        f = open(self.path, "rb")
+
+        def sheet_rows(info):
+            f.seek(info["offset"])
+            rows = _read_row_blocks(f)
+            if not visible_only:
+                yield from rows
+                return
+            position = 0
+            for start, stop in info["visible"]:
+                deque(itertools.islice(rows, start - position), maxlen=0)  # 略過隱藏列
+                yield from itertools.islice(rows, stop - start)
+                position = stop
+
+        def rows():
+            with f:
+                yield from sheet_rows(self.sheets[names[0]])
+                # 其他工作表依欄名對應到第一張表的欄位；多出來的欄位會被忽略
+                positions = {name: i for i, name in enumerate(columns)}
+                for name in names[1:]:
+                    info = self.sheets[name]
+                    mapping = [
+                        (src, positions[c])
+                        for src, c in enumerate(info["columns"])
+                        if c in positions
+                    ]
+                    for values in sheet_rows(info):
+                        row = [None] * width
+                        for src, dst in mapping:
+                            row[dst] = values[src]
+                        if any(cell_text(v) for v in row):
+                            yield tuple(row)
+
+        return RecipientStream(columns, rows(), self.row_count(sheet_name, visible_only))
+
+
+def iter_recipients(file_path, visible_only=False, sheet_name=None) -> RecipientStream:
+    """串流讀取收件人名單（CSV / Excel）；全空白的列會被略過。
+
+    .xlsx 透過 WorkbookIndex、.xls 透過 RecipientCache 讀取，來源檔沒變時不必再解析。
+    """
+    ext = Path(file_path).suffix.lower()
+    if ext == ".csv":
+        # CSV 本身就能快速串流，不另外快取
+        return _stream_csv(file_path)
+    if ext == ".xlsx":
+        index = WorkbookIndex.open(file_path)
+        if index is None:
+            return _stream_xlsx(file_path, visible_only, sheet_name)
+        return index.stream(sheet_name, visible_only)
+    if ext != ".xls":
+        raise ValueError(f"Unsupported file type: {file_path}")
+    cache = RecipientCache(file_path, visible_only, sheet_name)
+    return cache.load() or cache.record(_stream_xls(file_path, sheet_name))
 
 
-def load_recipients_or_csv(file_path, visible_only=False, sheet_name=None):
+def count_recipients(file_path, sheet_name=None) -> int:
+    """確認對話框顯示的收件人列數（只算可見列）。
+
+    .xlsx 直接取自 WorkbookIndex；CSV 只數換行（扣掉標題列），不解析內容；
+    .xls 把名單讀完一次，因此同時寫入 RecipientCache，寄送時不必再解析。
+    """
     ext = Path(file_path).suffix.lower()
     if ext == ".csv":
-        df = pd.read_csv(file_path)
-    elif ext in [".xls", ".xlsx"]:
-        if not visible_only:
-            if sheet_name == ALL_SHEETS:
-                xls = pd.ExcelFile(file_path)
-                df_list = [pd.read_excel(xls, sh) for sh in xls.sheet_names]
-                df = pd.concat(df_list, ignore_index=True)
+        return max(0, _count_lines(file_path) - 1)
+    if ext == ".xlsx":
+        index = WorkbookIndex.open(file_path)
+        if index is not None:
+            return index.row_count(sheet_name, visible_only=True)
+    return sum(1 for _ in iter_recipients(file_path, True, sheet_name))
+
+
+def _stream_xls(file_path, sheet_name) -> RecipientStream:
+    # 舊版 .xls 不是 zip 格式，只能交給 pandas 整份讀入
+    if sheet_name == ALL_SHEETS:
+        sheets = pd.read_excel(file_path, sheet_name=None)
+        df = pd.concat(sheets.values(), ignore_index=True)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name or 0)
+    rows = (
+        row
+        for row in df.itertuples(index=False, name=None)
+        if any(cell_text(v) for v in row)
+    )
+    return RecipientStream([str(c) for c in df.columns], rows, len(df))
+
+
+def _count_lines(file_path) -> int:
+    count = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CSV_COUNT_CHUNK):
+            count += chunk.count(b"\n")
+    return count
+
+
+def _stream_csv(file_path) -> RecipientStream:
+    with open(file_path, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        raise ValueError(f"CSV 檔案沒有標題列：{file_path}")
+    width = len(header)
+
+    def rows():
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                if not any(row):
+                    continue
+                if len(row) != width:
+                    row = (row + [""] * width)[:width]
+                yield tuple(row)
+
+    return RecipientStream(
+        [h.strip() for h in header], rows(), max(0, _count_lines(file_path) - 1)
+    )
+
+
+def _stream_xlsx(file_path, visible_only, sheet_name) -> RecipientStream:
+    reader = XlsxReader(file_path)
+    names = reader.sheet_names
+    if sheet_name == ALL_SHEETS:
+        sheets = names
+    else:
+        sheets = [sheet_name or names[0]]
+        if sheets[0] not in reader.sheets:
+            reader.close()
+            raise ValueError(f"找不到工作表：{sheets[0]}")
+
+    first = reader.iter_rows(sheets[0])
+    _, _, header = next(first, (0, False, []))
+    columns = [cell_text(h).strip() for h in header]
+    width = len(columns)
+    estimated = sum(max(0, reader.dimension_rows(sh) - 1) for sh in sheets)
+
+    def sheet_rows(rows, mapping):
+        for _, hidden, values in rows:
+            if visible_only and hidden:
+                continue
+            if mapping is None:
+                row = (values + [None] * width)[:width]
             else:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-        else:
-            wb = load_workbook(file_path, data_only=True)
-            sheets = (
-                wb.sheetnames
-                if sheet_name == ALL_SHEETS
-                else [sheet_name or wb.sheetnames[0]]
-            )
-            all_rows = []
-            headers = None
-            for sh in sheets:
-                ws = wb[sh]
-                if headers is None:
-                    headers = [cell.value for cell in ws[1]]
-                visible_rows = [
-                    [cell.value for cell in row]
-                    for row in ws.iter_rows(min_row=2)
-                    if not ws.row_dimensions[row[0].row].hidden
+                row = [None] * width
+                for src, dst in mapping:
+                    if src < len(values):
+                        row[dst] = values[src]
+            if any(cell_text(v) for v in row):
+                yield tuple(row)
+
+    def rows():
+        try:
+            yield from sheet_rows(first, None)
+            for sh in sheets[1:]:
+                sheet = reader.iter_rows(sh)
+                _, _, sheet_header = next(sheet, (0, False, []))
+                # 其他工作表依欄名對應到第一張表的欄位；多出來的欄位會被忽略
+                positions = {name: i for i, name in enumerate(columns)}
+                mapping = [
+                    (src, positions[cell_text(name).strip()])
+                    for src, name in enumerate(sheet_header)
+                    if cell_text(name).strip() in positions
                 ]
-                all_rows.extend(visible_rows)
-            df = pd.DataFrame(all_rows, columns=headers)
-    else:
-        raise ValueError(f"Unsupported file type: {file_path}")
+                yield from sheet_rows(sheet, mapping)
+        finally:
+            reader.close()
 
-    return df
+    return RecipientStream(columns, rows(), estimated)
 
 
-def validate_recipient_columns(df):
-    """Ensure required columns are present in the loaded DataFrame."""
+def validate_recipient_columns(columns):
+    """Ensure required columns are present in the loaded recipient list."""
     required = {"Email", "Salutation"}
-    missing = [col for col in required if col not in df.columns]
+    missing = [col for col in required if col not in columns]
     if missing:
         raise ValueError(f"Missing column(s): {', '.join(missing)}")
 
 
+class _FileLock:
+    """跨行程的獨占鎖（POSIX 用 fcntl.flock，Windows 用 msvcrt.locking）。"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if os.name == "nt":
+            import msvcrt
+
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK 重試約 10 秒後放棄，繼續等
+                    continue
+        else:
+            import fcntl
+
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            import msvcrt
+
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # 關檔同時釋放 flock
+        self._file = None
+
+
+class SuppressionIndex:
+    """Persistent suppression list: an mmap'ed open-addressing hash table on disk.
+
+    Addresses are normalised (trimmed, lower-cased) and stored as 64-bit
+    BLAKE2b digests, so lookups are O(1) and new exclusion files are merged
+    in place without rebuilding. A Bloom filter kept next to the table
+    answers most misses without touching the table pages.
+
+    Several processes (e.g. a GUI and a CLI run) may share one directory:
+    creating and merging take an exclusive file lock. Growing and clearing
+    never rewrite a file another process may have mapped (Windows refuses
+    to replace or resize those); they write the table and Bloom filter of a
+    new generation under new file names and then point ``current`` at it.
+    A process that finds a newer generation reopens it before merging; until
+    then its existing mapping stays valid (if stale). Older generations are
+    deleted once no process has them open.
+    """
+
+    HEADER = struct.Struct("<8sQQ")  # magic, slots, count
+    SLOT = struct.Struct("<Q")
+    MAGIC = b"AMSUPP01"
+
+    def __init__(self, directory, use_bloom=True):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._current_path = self.dir / "current"
+        self._sources_path = self.dir / "sources.json"
+        self._lock_path = self.dir / "lock"
+        self.use_bloom = use_bloom
+        self._generation = None
+        with _FileLock(self._lock_path):
+            self._load_sources()
+            generation = self._read_generation()
+            if not self._paths(generation)[0].exists():
+                self._write_generation([], SUPPRESSION_INITIAL_SLOTS)
+            else:
+                self._open(generation)
+            self._remove_stale()
+
+    def _paths(self, generation) -> tuple[Path, Path]:
+        # 第 0 代沿用舊版的檔名，既有的索引不必轉換
+        if generation == 0:
+            return self.dir / "index.bin", self.dir / "bloom.bin"
+        return self.dir / f"index.{generation}.bin", self.dir / f"bloom.{generation}.bin"
+
+    def _read_generation(self) -> int:
+        """呼叫端須持有檔案鎖：current 只在鎖內讀寫，換檔時不會有其他行程開著它。"""
+        try:
+            return int(self._current_path.read_text(encoding="ascii"))
+        except FileNotFoundError:
+            return 0
+
+    def _load_sources(self):
+        self._sources = {}
+        if self._sources_path.exists():
+            with open(self._sources_path, "r", encoding="utf-8") as f:
+                self._sources = json.load(f)
+
+    def _save_sources(self):
+        with open(self._sources_path, "w", encoding="utf-8") as f:
+            json.dump(self._sources, f, ensure_ascii=False, indent=2)
+
+    def _sync(self):
+        """取得鎖之後呼叫：其他行程可能已換上新一代索引，或併入了新清單。"""
+        generation = self._read_generation()
+        if generation != self._generation:
+            self.close()
+            self._open(generation)
+        else:
+            _, self._slots, self._count = self.HEADER.unpack_from(self._mm, 0)
+        self._load_sources()
+
+    @classmethod
+    def _create(cls, path, slots):
+        with open(path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, slots, 0))
+            f.truncate(cls.HEADER.size + slots * cls.SLOT.size)
+
+    def _values(self) -> list[int]:
+        return [
+            value
+            for offset in range(self.HEADER.size, len(self._mm), self.SLOT.size)
+            if (value := self.SLOT.unpack_from(self._mm, offset)[0])
+        ]
+
+    def _open(self, generation):
+        table_path, bloom_path = self._paths(generation)
+        self._file = open(table_path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, self._slots, self._count = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"排除索引格式錯誤：{table_path}")
+        self._generation = generation
+        # 每個槽位 8 bits；表最多 70% 滿，約等於每筆 11 bits，誤判率 < 1%
+        if not bloom_path.exists() or bloom_path.stat().st_size != self._slots:
+            # 舊版留下的 Bloom 檔不符時不能就地重建（其他行程可能正對應著），改寫成新一代
+            values = self._values()
+            self.close()
+            self._write_generation(values, self._slots)
+            return
+        self._bloom_file = open(bloom_path, "r+b")
+        self._bloom = mmap.mmap(self._bloom_file.fileno(), 0)
+
+    def _write_generation(self, values, slots):
+        """呼叫端須持有檔案鎖：把 values 寫成新一代的索引與 Bloom 檔，再換上並開啟。"""
+        generation = self._read_generation() + 1
+        table_path, bloom_path = self._paths(generation)
+        self._create(table_path, slots)
+        with open(table_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as mm:
+            mask = slots - 1
+            for value in values:
+                slot = value & mask
+                while self.SLOT.unpack_from(mm, self.HEADER.size + slot * self.SLOT.size)[0]:
+                    slot = (slot + 1) & mask
+                self.SLOT.pack_into(mm, self.HEADER.size + slot * self.SLOT.size, value)
+            self.HEADER.pack_into(mm, 0, self.MAGIC, slots, len(values))
+        with open(bloom_path, "wb") as f:
+            f.truncate(slots)
+        with open(bloom_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as bloom:
+            for value in values:
+                self._bloom_add(bloom, value)
+        # current 只在鎖內開啟，os.replace 不會碰到被其他行程開著的檔案
+        tmp = self._current_path.with_suffix(".tmp")
+        tmp.write_text(str(generation), encoding="ascii")
+        os.replace(tmp, self._current_path)
+        self.close()
+        self._open(generation)
+        self._remove_stale()
+
+    def _remove_stale(self):
+        """刪掉舊世代的檔案；Windows 上仍被其他行程對應的會刪不掉，留待下次。"""
+        keep = set(self._paths(self._generation))
+        for path in [*self.dir.glob("index*.bin"), *self.dir.glob("bloom*.bin")]:
+            if path not in keep:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _bloom_bits(bloom, value):
+        nbits = len(bloom) * 8
+        h1, h2 = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(h1 + k * h2) % nbits for k in range(BLOOM_HASHES)]
+
+    @classmethod
+    def _bloom_add(cls, bloom, value):
+        for bit in cls._bloom_bits(bloom, value):
+            bloom[bit >> 3] |= 1 << (bit & 7)
+
+    def close(self):
+        for name in ("_bloom", "_bloom_file", "_mm", "_file"):
+            handle = getattr(self, name, None)
+            if handle is not None:
+                handle.close()
+                setattr(self, name, None)
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _hash(address) -> int:
+        key = cell_text(address).strip().lower().encode("utf-8")
+        value = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+        return value or 1  # 0 代表空槽
+
+    def _probe(self, value) -> tuple[int, bool]:
+        """回傳 value 所在（或可插入）的槽位位移，以及是否已存在。"""
+        mask = self._slots - 1
+        slot = value & mask
+        while True:
+            offset = self.HEADER.size + slot * self.SLOT.size
+            (current,) = self.SLOT.unpack_from(self._mm, offset)
+            if current == value:
+                return offset, True
+            if current == 0:
+                return offset, False
+            slot = (slot + 1) & mask
+
+    def __contains__(self, address) -> bool:
+        value = self._hash(address)
+        if self.use_bloom:
+            for bit in self._bloom_bits(self._bloom, value):
+                if not self._bloom[bit >> 3] & (1 << (bit & 7)):
+                    return False
+        return self._probe(value)[1]
+
+    def add(self, address) -> bool:
+        """加入一個地址；已存在則回傳 False。呼叫端須持有檔案鎖（見 add_file）。"""
+        value = self._hash(address)
+        offset, found = self._probe(value)
+        if found:
+            return False
+        if (self._count + 1) > self._slots * SUPPRESSION_MAX_LOAD:
+            self._grow()
+            offset, _ = self._probe(value)
+        self.SLOT.pack_into(self._mm, offset, value)
+        self._count += 1
+        self.HEADER.pack_into(self._mm, 0, self.MAGIC, self._slots, self._count)
+        # use_bloom 只影響查詢；Bloom 檔一律維護，共用索引的其他行程才不會漏判
+        self._bloom_add(self._bloom, value)
+        return True
+
+    def _grow(self):
+        self._write_generation(self._values(), self._slots * 2)
+
+    def add_file(self, file_path, sheet_name=None) -> int:
+        """併入一份排除清單（需有 Email 欄）；檔案未變動過就略過。回傳新增筆數。"""
+        path = Path(file_path).resolve()
+        stat = path.stat()
+        key = f"{path}|{sheet_name or ''}"
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with _FileLock(self._lock_path):
+            self._sync()
+            if self._sources.get(key) == stamp:
+                return 0
+            stream = iter_recipients(path, sheet_name=sheet_name)
+            col = stream.columns.index("Email")
+            added = sum(
+                self.add(row[col]) for row in stream if cell_text(row[col]).strip()
+            )
+            self._mm.flush()
+            self._bloom.flush()
+            self._sources[key] = stamp
+            self._save_sources()
+        return added
+
+    def clear(self) -> None:
+        """清空索引與已併入清單的紀錄；之後只排除再次併入的地址。"""
+        with _FileLock(self._lock_path):
+            self._write_generation([], SUPPRESSION_INITIAL_SLOTS)
+            self._sources = {}
+            self._save_sources()
+
+
+class SendJournal:
+    """Per-campaign SQLite (WAL) journal of each recipient's delivery status.
+
+    Status rows are buffered and written in batched transactions. ``mark``
+    returns a ticket; ``ensure`` commits everything up to that ticket before
+    the message is handed to the backend, so after a crash a recipient is
+    ``sent``/``failed``, ``in_flight`` (outcome unknown, re-queued on resume)
+    or absent (never attempted).
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS recipients (
+                email TEXT PRIMARY KEY,
+                row_index INTEGER,
+                status TEXT,
+                updated REAL,
+                response TEXT
+            )"""
+        )
+        if resume:
+            self.delivered = {
+                email
+                for (email,) in self._db.execute(
+                    "SELECT email FROM recipients WHERE status = 'sent'"
+                )
+            }
+        else:
+            self._db.execute("DELETE FROM recipients")
+            self.delivered = set()
+        self._pending = []
+        self._issued = 0
+        self._committed = 0
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def campaign_path(journal_dir, recipients_path, sheet, template_path, mode):
+        """同一份名單＋工作表＋範本＋模式視為同一個寄送活動。"""
+        key = json.dumps(
+            [str(Path(recipients_path).resolve()), sheet,
+             str(Path(template_path).resolve()), mode],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        return Path(journal_dir) / f"{Path(recipients_path).stem}-{digest}.sqlite"
+
+    def mark(self, email, row_index, status, response=None) -> int:
+        """緩衝一筆狀態更新，回傳其序號供 ensure 使用。"""
+        with self._lock:
+            self._pending.append((email, row_index, status, time.time(), response))
+            self._issued += 1
+            ticket = self._issued
+            if (
+                len(self._pending) >= JOURNAL_BATCH
+                or time.monotonic() - self._last_flush >= JOURNAL_FLUSH_SECONDS
+            ):
+                self._flush_locked()
+            return ticket
+
+    def ensure(self, ticket) -> None:
+        """確保序號 ticket（含）之前的紀錄都已寫入磁碟。"""
+        with self._lock:
+            if self._committed < ticket:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO recipients"
+                    " (email, row_index, status, updated, response)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            self._pending.clear()
+        self._committed = self._issued
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+class DeadLetterFile:
+    """CSV of recipients whose transient failures outlasted every retry.
+
+    Rows keep the recipient list's columns (plus ``Error``), so the file can
+    be picked as the recipient list of a follow-up run. It is created on the
+    first row.
+    """
+
+    def __init__(self, path, columns):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.count = 0
+        self._file = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def add(self, values, error) -> None:
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # utf-8-sig 讓 Excel 直接開啟也不會亂碼
+                self._file = open(self.path, "w", newline="", encoding="utf-8-sig")
+                self._writer = csv.writer(self._file)
+                self._writer.writerow([*self.columns, "Error"])
+            self._writer.writerow([*map(cell_text, values), str(error)])
+            self._file.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+
 def get_base_dir():
+    # AUTOMAILER_HOME 可把設定、快取與紀錄改放到別的資料夾（例如基準測試）
+    if os.environ.get("AUTOMAILER_HOME"):
+        return Path(os.environ["AUTOMAILER_HOME"])
     if getattr(sys, "frozen", False):
         return Path(sys.executable).parent
     else:
@@ -316,6 +2910,112 @@ def load_embeds(embed_dir):
     }
 
 
+def optimize_images(embedded_images, max_width, quality, logger):
+    """縮小並重新壓縮嵌入圖片，回傳 ({cid: 路徑}, 原始總位元組, 最佳化後總位元組)。
+
+    寬度超過 ``max_width`` 的圖片會等比例縮小，並去掉 EXIF 等中繼資料。結果以
+    原檔內容＋參數的 SHA-256 為鍵快取在 IMAGE_CACHE_DIR，之後的執行直接沿用；
+    沒有變小的圖片（或動態 GIF、無法解析的檔案）沿用原檔。未安裝 Pillow 時
+    整個步驟略過。
+    """
+    paths = {cid: Path(p) for cid, p in embedded_images.items()}
+    before = sum(file_size(p) for p in paths.values())
+    if not paths or not max_width:
+        return paths, before, before
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger("⚠️ 未安裝 Pillow，略過圖片最佳化")
+        return paths, before, before
+
+    cache_dir = get_base_dir() / IMAGE_CACHE_DIR
+    result = {}
+    for cid, path in paths.items():
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            # 找不到或讀不到的圖片保留原路徑，寄送時再逐封回報
+            logger(f"⚠️ 無法讀取圖片 {path.name}: {e}")
+            result[cid] = path
+            continue
+        digest = hashlib.sha256(
+            b"%d:%d:%d:" % (IMAGE_CACHE_VERSION, int(max_width), int(quality)) + data
+        ).hexdigest()
+        cached = cache_dir / digest / path.name
+        if cached.exists():
+            result[cid] = cached
+            continue
+        try:
+            with Image.open(path) as img:
+                fmt = img.format
+                if getattr(img, "n_frames", 1) > 1 or fmt not in ("PNG", "JPEG", "GIF"):
+                    result[cid] = path
+                    continue
+                # 去掉 EXIF 前先依方向資訊轉正
+                out = ImageOps.exif_transpose(img)
+                if out.width > max_width:
+                    height = max(1, round(out.height * max_width / out.width))
+                    out = out.resize((int(max_width), height), Image.LANCZOS)
+                buf = io.BytesIO()
+                # 只保留色彩描述檔，其他中繼資料一律不寫入
+                options = {"optimize": True}
+                if img.info.get("icc_profile"):
+                    options["icc_profile"] = img.info["icc_profile"]
+                if fmt == "JPEG":
+                    out = out.convert("RGB")
+                    options.update(quality=int(quality), progressive=True)
+                elif fmt == "GIF" and "transparency" in img.info:
+                    options["transparency"] = img.info["transparency"]
+                out.save(buf, format=fmt, **options)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger(f"⚠️ 圖片最佳化失敗，使用原檔 {path.name}: {e}")
+            result[cid] = path
+            continue
+        optimized = buf.getvalue()
+        if len(optimized) >= len(data):
+            optimized = data
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_name(cached.name + ".tmp")
+            tmp.write_bytes(optimized)
+            os.replace(tmp, cached)
+            result[cid] = cached
+        except OSError as e:
+            logging.error(f"Failed to cache image: {e}")
+            result[cid] = path
+    after = sum(file_size(p) for p in result.values())
+    return result, before, after
+
+
+def file_size(path) -> int:
+    """檔案大小；讀不到（例如設定檔裡已刪除的附件）時算 0，留給寄送時逐封回報。"""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def format_bytes(size) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def image_savings_text(before: int, after: int, messages: int | None) -> str:
+    """圖片最佳化前後的大小；有收件人數時一併換算整批寄送的總量。"""
+    text = f"每封 {format_bytes(before)} → {format_bytes(after)}"
+    if messages:
+        saved = (before - after) * messages
+        text += (
+            f"，{messages:,} 封共 {format_bytes(before * messages)} → "
+            f"{format_bytes(after * messages)}，省下 {format_bytes(saved)}"
+        )
+    return text
+
+
 def load_attachments(attachment_dir):
     """載入附件檔案，回傳 Path list。"""
     if attachment_dir is None:
@@ -324,6 +3024,134 @@ def load_attachments(attachment_dir):
     return [f.resolve() for f in attachment_dir.glob("*") if f.is_file()]
 
 
+def wait_if_paused(pause_event, cancel_event) -> bool:
+    """暫停時阻塞直到繼續；若期間被取消則回傳 False。"""
+    while not pause_event.is_set():
+        if cancel_event.is_set():
+            return False
+        time.sleep(0.1)
+    return not cancel_event.is_set()
+
+
+def put_unless_cancelled(q, item, cancel_event) -> bool:
+    """放入有上限的佇列；佇列滿時等待，期間被取消則回傳 False。"""
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if cancel_event.is_set():
+                return False
+
+
+class _OrderedProgress:
+    """讓並行完成的郵件依原始順序回報進度。"""
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._next = 0
+        self._pending = {}
+        self.last_index = None
+
+    def done(self, seq, args=None):
+        """標記第 seq 封完成；args 為 None 表示略過（例如已取消）不回報。"""
+        with self._lock:
+            self._pending[seq] = args
+            while self._next in self._pending:
+                ready = self._pending.pop(self._next)
+                self._next += 1
+                if ready is not None:
+                    # 重寄的信列號較小，last_index 只往前推進
+                    if self.last_index is None or ready[0] > self.last_index:
+                        self.last_index = ready[0]
+                    self._callback(*ready)
+
+
+class ProgressChannel:
+    """工作執行緒只更新計數，顯示端（Tk 主迴圈、CLI）再自行讀取快照。
+
+    update/finish 的參數與 run_automailer 的 progress_update/finish_callback
+    相同，可直接傳入。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.monotonic()
+            self._recent = deque(maxlen=PROGRESS_RATE_WINDOW)  # (時間, 列號)
+            self._done = 0
+            self._failed = 0
+            self._last_index = None
+            self._total = 0
+            self._current = ""
+            self._finished = False
+            self._version = 0
+
+    def update(self, index, total, current_email):
+        failed = current_email.endswith(" ❌")
+        with self._lock:
+            if self._last_index is not None:
+                index = max(index, self._last_index)  # 重寄的信列號較小
+            self._recent.append((time.monotonic(), index))
+            self._done += 1
+            self._failed += failed
+            self._last_index = index
+            self._total = total
+            self._current = current_email
+            self._version += 1
+
+    def finish(self, last_index, total):
+        with self._lock:
+            if last_index is not None:
+                self._last_index = last_index
+            self._total = total
+            self._finished = True
+            self._version += 1
+
+    @property
+    def failed(self):
+        with self._lock:
+            return self._failed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = list(self._recent) if len(self._recent) > 1 else []
+            snap = {
+                "version": self._version,
+                "done": self._done,
+                "failed": self._failed,
+                "last_index": self._last_index,
+                "total": self._total,
+                "current": self._current,
+                "elapsed": time.monotonic() - self._started,
+                "finished": self._finished,
+            }
+        rate = eta = None
+        if recent:
+            span = recent[-1][0] - recent[0][0]
+            if span > 0:
+                rate = (len(recent) - 1) / span
+                rows_per_second = (recent[-1][1] - recent[0][1]) / span
+                position = snap["last_index"] + 1
+                if rows_per_second > 0:
+                    eta = max(0.0, (snap["total"] - position) / rows_per_second)
+        snap["rate"] = rate
+        snap["eta"] = eta
+        return snap
+
+
+def format_duration(seconds) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{sec:02d}" if hours else f"{minutes:02d}:{sec:02d}"
+
+
 def generate_image_html(embeds):
     return "".join(
         f'<img src="cid:{cid}" style="display:block; margin-bottom:10px;"><br>'
@@ -331,6 +3159,119 @@ def generate_image_html(embeds):
     )
 
 
+# ─────────────────────────────
+# 📝 Template
+# ─────────────────────────────
+PLACEHOLDER_RE = re.compile(r"\[([^\[\]<>\r\n]{1,64})\]")
+IMAGE_PLACEHOLDER_RE = re.compile(r"image(\d*)", re.IGNORECASE)
+STATEMENT_SLOT = -1
+
+
+def cell_text(value) -> str:
+    """把儲存格的值轉成要填進信件的文字；空值（None/NaN）為空字串。"""
+    if value is None or value != value:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def tokenize_template(html_body: str) -> list[str]:
+    """切成 [文字, 佔位符, 文字, 佔位符, …, 文字]；與欄位、圖片無關，可快取。"""
+    tokens = []
+    pos = 0
+    for match in PLACEHOLDER_RE.finditer(html_body):
+        tokens.append(html_body[pos : match.start()])
+        tokens.append(match.group(0))
+        pos = match.end()
+    tokens.append(html_body[pos:])
+    return tokens
+
+
+class MessageTemplate:
+    """HTML body compiled once into literal segments and placeholder slots.
+
+    ``[statement]`` and ``[AnyColumnName]`` (case-insensitive, so
+    ``[salutation]`` keeps mapping to the ``Salutation`` column) become slots;
+    ``[image]``/``[imageN]`` are resolved to their HTML at compile time.
+    Unknown bracketed text is left untouched.
+    """
+
+    def __init__(self, html_body, columns, embedded_images, logger, tokens=None):
+        if tokens is None:
+            tokens = tokenize_template(html_body)
+        cid_list = list(embedded_images)
+        column_index = {}
+        for idx, name in enumerate(columns):
+            column_index.setdefault(str(name).strip().lower(), idx)
+
+        pieces = [tokens[0]]
+        slots = []
+        for k in range(1, len(tokens), 2):
+            placeholder, literal = tokens[k], tokens[k + 1]
+            name = placeholder[1:-1].strip().lower()
+            image = IMAGE_PLACEHOLDER_RE.fullmatch(name)
+            if name == "statement":
+                slots.append((len(pieces), STATEMENT_SLOT))
+                pieces.extend((None, literal))
+            elif image:
+                idx = image.group(1)
+                index = int(idx) - 1 if idx else None  # 讓 [image1] 代表第一張圖
+                if index is None:
+                    pieces[-1] += generate_image_html(cid_list)
+                elif 0 <= index < len(cid_list):
+                    pieces[-1] += generate_image_html([cid_list[index]])
+                else:
+                    logger(f"⚠️ 無效的圖片佔位符：[image{idx}] → 找不到對應圖片")
+                pieces[-1] += literal
+            elif name in column_index:
+                slots.append((len(pieces), column_index[name]))
+                pieces.extend((None, literal))
+            else:
+                pieces[-1] += placeholder + literal
+
+        self._pieces = pieces
+        self._slots = slots
+
+    def render(self, values, statement: str) -> str:
+        """依一列收件人資料（與 columns 同順序）產生信件 HTML。"""
+        pieces = self._pieces.copy()
+        for pos, slot in self._slots:
+            pieces[pos] = (
+                statement if slot == STATEMENT_SLOT else cell_text(values[slot])
+            )
+        return "".join(pieces)
+
+
+_render_template = None
+_render_mime = True
+
+
+def _init_render_worker(template: MessageTemplate, encode_mime: bool) -> None:
+    """套版行程的 initializer：每個行程只收一次編譯好的範本。"""
+    global _render_template, _render_mime
+    _render_template = template
+    _render_mime = encode_mime
+
+
+def _render_chunk(rows) -> list:
+    """在套版行程中處理一批 (列資料, 結尾詞)。
+
+    回傳每列的 (HTML, MIME 分段, 秒數)；失敗的列以例外取代 HTML。
+    """
+    results = []
+    for values, statement in rows:
+        started = time.perf_counter()
+        try:
+            body = _render_template.render(values, statement)
+            part = encode_html_part(body) if _render_mime else None
+        except Exception as e:
+            # 例外不一定能 pickle，只帶訊息回去
+            body, part = RuntimeError(str(e)), None
+        results.append((body, part, time.perf_counter() - started))
+    return results
+
+
 # ─────────────────────────────
 # 🖥️ GUI Class
 # ─────────────────────────────
@@ -340,32 +3281,37 @@ class GUI:
         self.root.title("Automailer 自動寄信工具")
 
         # 模式切換（寄送或存稿）
-        self.mode_var = StringVar(value="draft")
+        self.mode_var = tk.StringVar(value="draft")
         self.recipient_file = ""
         self.exclusion_file = ""
         self.msg_template = ""
         self.embed_dir = None
         self.attachment_dir = None
 
-        self.embed_files = StringVar(value="尚未選擇")
-        self.attachment_files = StringVar(value="尚未選擇")
-        self.recipient_label = StringVar(value="尚未選擇")
-        self.exclusion_label = StringVar(value="尚未選擇")
-        self.template_label = StringVar(value="尚未選擇")
-        self.select_mode_var = StringVar(value="資料夾")  # 預設「資料夾」模式
+        self.embed_files = tk.StringVar(value="尚未選擇")
+        self.attachment_files = tk.StringVar(value="尚未選擇")
+        self.recipient_label = tk.StringVar(value="尚未選擇")
+        self.exclusion_label = tk.StringVar(value="尚未選擇")
+        self.template_label = tk.StringVar(value="尚未選擇")
+        self.select_mode_var = tk.StringVar(value="資料夾")  # 預設「資料夾」模式
         self.folder_mode = True  # 與前保持一致的布林旗標
         self.embed_paths = {}  # 字典
         self.attachments = []
-        self.recipient_sheet_var = StringVar(value=ALL_SHEETS)
-        self.exclusion_sheet_var = StringVar(value=ALL_SHEETS)
+        self.recipient_sheet_var = tk.StringVar(value=ALL_SHEETS)
+        self.exclusion_sheet_var = tk.StringVar(value=ALL_SHEETS)
 
         # 進度文字和 Progressbar
-        self.progress_label = StringVar(value="")
+        self.progress_label = tk.StringVar(value="")
         self.progress_bar = None
+        self.progress_channel = ProgressChannel()
+        self.progress_version = 0
 
-        # 日誌視窗相關
+        # 日誌視窗相關：只保留最近 LOG_BUFFER_LINES 行，新行先進 pending 再批次寫入視窗
         self.log_window = None
-        self.log_buffer = ["✅ 程式已啟動"]
+        self.log_buffer = deque(["✅ 程式已啟動"], maxlen=LOG_BUFFER_LINES)
+        self.log_pending = deque(maxlen=LOG_BUFFER_LINES)
+        self.log_lock = threading.Lock()
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
 
         # ─── pause_event & cancel_event ───
         self.pause_event = threading.Event()
@@ -373,20 +3319,24 @@ class GUI:
 
         self.cancel_event = threading.Event()  # 一開始為 False，代表未取消
 
-        # ——取得 Outlook Accounts ——
-        outlook_app = win32.Dispatch("Outlook.Application")
-        session = outlook_app.GetNamespace("MAPI")
-        accounts = [acct.DisplayName for acct in session.Accounts]
+        # ——取得 Outlook Accounts（非 Windows 或沒有 Outlook 時只能用 SMTP）——
+        try:
+            outlook_app = win32.Dispatch("Outlook.Application")
+            session = outlook_app.GetNamespace("MAPI")
+            accounts = [acct.DisplayName for acct in session.Accounts]
+        except Exception as e:
+            logging.info(f"Outlook 無法使用：{e}")
+            accounts = []
 
         # 如果只有一個帳戶，也把它放進去
         if not accounts:
             accounts = ["(No Account Found)"]
-        self.account_var = StringVar(root)
-        self.backend_var = StringVar(value="Outlook")
-        self.smtp_host = StringVar(value="")
-        self.smtp_port = StringVar(value="587")
-        self.smtp_user = StringVar(value="")
-        self.smtp_pass = StringVar(value="")
+        self.account_var = tk.StringVar(root)
+        self.backend_var = tk.StringVar(value="Outlook")
+        self.smtp_host = tk.StringVar(value="")
+        self.smtp_port = tk.StringVar(value="587")
+        self.smtp_user = tk.StringVar(value="")
+        self.smtp_pass = tk.StringVar(value="")
 
         # 讀取設定檔並套用
         cfg = load_settings_file()
@@ -432,19 +3382,20 @@ class GUI:
                 self.attachments = [Path(p) for p in attach_list]
                 self.attachment_files.set(", ".join(Path(p).name for p in self.attachments))
         saved_closing = cfg.get("closing_statements")
+        self.tuning = {k: cfg.get(k, v) for k, v in TUNING_DEFAULTS.items()}
 
         # ──────────────── UI Frames ────────────────
-        mode_frame = Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
+        mode_frame = tk.Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
         mode_frame.grid(row=0, column=0, columnspan=2, sticky="EW")
-        self.account_label = Label(mode_frame, text="寄件帳戶：")
+        self.account_label = tk.Label(mode_frame, text="寄件帳戶：")
         self.account_label.grid(row=0, column=0, sticky="w", pady=5)
 
-        self.account_menu = OptionMenu(mode_frame, self.account_var, *accounts)
+        self.account_menu = tk.OptionMenu(mode_frame, self.account_var, *accounts)
         self.account_menu.grid(row=0, column=1, sticky="W", pady=5)
         self.account_menu.config(width=20)
 
-        Label(mode_frame, text="寄信後端:").grid(row=1, column=0, sticky="W")
-        backend_menu = OptionMenu(
+        tk.Label(mode_frame, text="寄信後端:").grid(row=1, column=0, sticky="W")
+        backend_menu = tk.OptionMenu(
             mode_frame,
             self.backend_var,
             "Outlook",
@@ -454,59 +3405,70 @@ class GUI:
         backend_menu.config(width=7)
         backend_menu.grid(row=1, column=1, sticky="W")
 
-        Label(mode_frame, text="選擇寄送模式:").grid(row=2, column=0, sticky="W")
-        mode_menu = OptionMenu(mode_frame, self.mode_var, "send", "draft")
+        tk.Label(mode_frame, text="選擇寄送模式:").grid(row=2, column=0, sticky="W")
+        mode_menu = tk.OptionMenu(mode_frame, self.mode_var, "send", "draft")
         mode_menu.config(width=5)
         mode_menu.grid(row=2, column=1, sticky="W")
 
-        self.smtp_frame = Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
+        self.resume_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            mode_frame, text="從上次中斷處續寄", variable=self.resume_var
+        ).grid(row=3, column=0, columnspan=2, sticky="W")
+        self.rebuild_suppression_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            mode_frame,
+            text="重建排除索引（只保留這次的排除清單）",
+            variable=self.rebuild_suppression_var,
+        ).grid(row=4, column=0, columnspan=2, sticky="W")
+
+        self.smtp_frame = tk.Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
         self.smtp_frame.grid(row=1, column=0, columnspan=2, sticky="EW")
-        Label(self.smtp_frame, text="SMTP 主機:").grid(row=0, column=0, sticky="W")
-        Entry(self.smtp_frame, textvariable=self.smtp_host, width=25).grid(
+        tk.Label(self.smtp_frame, text="SMTP 主機:").grid(row=0, column=0, sticky="W")
+        tk.Entry(self.smtp_frame, textvariable=self.smtp_host, width=25).grid(
             row=0, column=1, sticky="W"
         )
-        Label(self.smtp_frame, text="Port:").grid(row=0, column=2, sticky="W")
-        Entry(self.smtp_frame, textvariable=self.smtp_port, width=5).grid(
+        tk.Label(self.smtp_frame, text="Port:").grid(row=0, column=2, sticky="W")
+        tk.Entry(self.smtp_frame, textvariable=self.smtp_port, width=5).grid(
             row=0, column=3, sticky="W"
         )
-        Label(self.smtp_frame, text="User:").grid(row=1, column=0, sticky="W")
-        Entry(self.smtp_frame, textvariable=self.smtp_user, width=25).grid(
+        tk.Label(self.smtp_frame, text="User:").grid(row=1, column=0, sticky="W")
+        tk.Entry(self.smtp_frame, textvariable=self.smtp_user, width=25).grid(
             row=1, column=1, sticky="W"
         )
-        Label(self.smtp_frame, text="Password:").grid(row=1, column=2, sticky="W")
-        Entry(self.smtp_frame, textvariable=self.smtp_pass, show="*", width=10).grid(
+        tk.Label(self.smtp_frame, text="Password:").grid(row=1, column=2, sticky="W")
+        tk.Entry(self.smtp_frame, textvariable=self.smtp_pass, show="*", width=10).grid(
             row=1, column=3, sticky="W"
         )
         self.smtp_frame.grid_remove()
 
-        file_frame = Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
+        file_frame = tk.Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
         file_frame.grid(row=2, column=0, columnspan=2, sticky="EW")
-        self.embed_btn = Button(
+        self.embed_btn = tk.Button(
             file_frame, text="🖼 選擇圖片資料夾", command=self.select_embed, width=20
         )
         self.embed_btn.grid(row=1, column=0, pady=5)
-        Label(
+        tk.Label(
             file_frame, textvariable=self.embed_files, wraplength=270, justify="left"
         ).grid(row=1, column=1, sticky="W")
 
-        self.attachment_btn = Button(
+        self.attachment_btn = tk.Button(
             file_frame,
             text="📎 選擇附件資料夾",
             command=self.select_attachment,
             width=20,
         )
         self.attachment_btn.grid(row=2, column=0, pady=5)
-        Label(
+        tk.Label(
             file_frame,
             textvariable=self.attachment_files,
             wraplength=270,
             justify="left",
         ).grid(row=2, column=1, sticky="W")
 
-        inner_frame1 = Frame(file_frame, borderwidth=0)
+        inner_frame1 = tk.Frame(file_frame, borderwidth=0)
         inner_frame1.grid(row=0, column=0, columnspan=2, sticky="EW")
-        Label(inner_frame1, text="選取模式：").grid(row=0, column=0, sticky="W", pady=5)
-        mode_select = OptionMenu(
+        tk.Label(inner_frame1, text="選取模式：").grid(row=0, column=0, sticky="W", pady=5)
+        mode_select = tk.OptionMenu(
             inner_frame1,
             self.select_mode_var,
             "資料夾",
@@ -516,32 +3478,32 @@ class GUI:
         mode_select.config(width=8)
         mode_select.grid(row=0, column=1, sticky="W", pady=5)
 
-        choose_frame = Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
+        choose_frame = tk.Frame(root, pady=5, padx=5, relief="groove", borderwidth=2)
         choose_frame.grid(row=3, column=0, columnspan=2, sticky="EW")
-        Button(
+        tk.Button(
             choose_frame, text="📋 選擇收件人", command=self.load_recipients, width=20
         ).grid(row=0, column=0, pady=5)
-        Label(
+        tk.Label(
             choose_frame,
             textvariable=self.recipient_label,
             wraplength=270,
             justify="left",
         ).grid(row=0, column=1, sticky="W")
-        self.recipient_sheet_menu = OptionMenu(
+        self.recipient_sheet_menu = tk.OptionMenu(
             choose_frame, self.recipient_sheet_var, self.recipient_sheet_var.get()
         )
         self.recipient_sheet_menu.config(width=8)
         self.recipient_sheet_menu.grid(row=0, column=2, sticky="W")
-        Button(
+        tk.Button(
             choose_frame, text="🚫 選擇排除清單", command=self.load_exclusions, width=20
         ).grid(row=1, column=0, pady=5)
-        Label(
+        tk.Label(
             choose_frame,
             textvariable=self.exclusion_label,
             wraplength=270,
             justify="left",
         ).grid(row=1, column=1, sticky="W")
-        self.exclusion_sheet_menu = OptionMenu(
+        self.exclusion_sheet_menu = tk.OptionMenu(
             choose_frame, self.exclusion_sheet_var, self.exclusion_sheet_var.get()
         )
         self.exclusion_sheet_menu.config(width=8)
@@ -553,44 +3515,51 @@ class GUI:
                 self.recipient_sheet_var,
                 get_excel_sheets(self.recipient_file),
             )
+            self.index_workbook(
+                self.recipient_file, self.recipient_sheet_menu, self.recipient_sheet_var
+            )
         if self.exclusion_file:
             self.update_sheet_menu(
                 self.exclusion_sheet_menu,
                 self.exclusion_sheet_var,
                 get_excel_sheets(self.exclusion_file),
             )
-        Button(
+            self.index_workbook(
+                self.exclusion_file, self.exclusion_sheet_menu, self.exclusion_sheet_var
+            )
+        tk.Button(
             choose_frame,
             text="✉ 選擇郵件範本",
             command=self.load_msg_template,
             width=20,
         ).grid(row=2, column=0, pady=5)
-        Label(
+        tk.Label(
             choose_frame,
             textvariable=self.template_label,
             wraplength=270,
             justify="left",
         ).grid(row=2, column=1, sticky="W")
 
-        Button(root, text="🚀 開始寄信", command=self.start_process).grid(
-            row=4, column=0, pady=10
+        self.start_button = tk.Button(
+            root, text="🚀 開始寄信", command=self.start_process
         )
-        Button(root, text="🪵 查看日誌", command=self.show_log_window).grid(
+        self.start_button.grid(row=4, column=0, pady=10)
+        tk.Button(root, text="🪵 查看日誌", command=self.show_log_window).grid(
             row=4, column=1
         )
 
-        Label(root, text="結尾詞 (一行一個)").grid(row=5, column=0, columnspan=2)
+        tk.Label(root, text="結尾詞 (一行一個)").grid(row=5, column=0, columnspan=2)
         self.closing_text = scrolledtext.ScrolledText(root, height=7, width=50)
         self.closing_text.grid(row=6, column=0, columnspan=2)
         if saved_closing:
-            self.closing_text.insert(END, "\n".join(saved_closing))
+            self.closing_text.insert(tk.END, "\n".join(saved_closing))
             self.closing_statements = saved_closing
         else:
-            self.closing_text.insert(END, "\n".join(DEFAULT_CLOSING_STATEMENTS))
+            self.closing_text.insert(tk.END, "\n".join(DEFAULT_CLOSING_STATEMENTS))
             self.closing_statements = DEFAULT_CLOSING_STATEMENTS
 
         # ─── Pause/Resume 按鈕 & Cancel 按鈕（一開始先放位置，再隱藏） ───
-        self.pause_button = Button(
+        self.pause_button = tk.Button(
             root,
             text="暫停",
             font=("Arial", 12, "bold"),
@@ -603,7 +3572,7 @@ class GUI:
         self.pause_button.grid(row=8, column=0, pady=5)
         self.pause_button.grid_remove()  # 先隱藏
 
-        self.cancel_button = Button(
+        self.cancel_button = tk.Button(
             root,
             text="取消",
             font=("Arial", 12, "bold"),
@@ -617,13 +3586,13 @@ class GUI:
         self.cancel_button.grid_remove()  # 先隱藏
 
         # ────────────── 進度區塊 ──────────────
-        Label(root, textvariable=self.progress_label).grid(
+        tk.Label(root, textvariable=self.progress_label).grid(
             row=10, column=0, columnspan=2, pady=5, sticky="S"
         )
         self.progress_bar = ttk.Progressbar(root, length=300, mode="determinate")
         self.progress_bar.grid(row=11, column=0, columnspan=2, pady=5)
 
-        self.save_button = Button(root, text="💾 儲存設定", command=self.save_settings)
+        self.save_button = tk.Button(root, text="💾 儲存設定", command=self.save_settings)
         self.save_button.grid(row=12, column=0, columnspan=2, pady=5)
 
     def on_select_mode(self, choice):
@@ -716,12 +3685,41 @@ class GUI:
         self.attachment_files.set(", ".join(file_names) or "無檔案")
         self.log(f"✅ 已載入 {len(self.attachments)} 個附件")
 
-    def update_sheet_menu(self, menu, var, sheets):
+    def update_sheet_menu(self, menu, var, sheets, index=None):
         menu["menu"].delete(0, "end")
         options = [ALL_SHEETS] + sheets if sheets else [ALL_SHEETS]
         for s in options:
-            menu["menu"].add_command(label=s, command=lambda v=s: var.set(v))
-        var.set(ALL_SHEETS)
+            label = s
+            if index is not None and s in index.sheets:
+                label = f"{s}（{index.describe(s)}）"
+            menu["menu"].add_command(label=label, command=lambda v=s: var.set(v))
+        if index is None:
+            var.set(ALL_SHEETS)
+
+    def index_workbook(self, path, menu, var):
+        """工作表選單先顯示名稱；背景建好活頁簿索引後再標上各表列數。"""
+        if Path(path).suffix.lower() != ".xlsx":
+            return
+
+        def build():
+            try:
+                index = WorkbookIndex.open(path)
+            except Exception as e:
+                logging.info(f"無法建立活頁簿索引：{e}")
+                return
+            if index is not None:
+                self.root.after(0, lambda: show(index))
+
+        def show(index):
+            current = (
+                self.recipient_file
+                if menu is self.recipient_sheet_menu
+                else self.exclusion_file
+            )
+            if current == path:  # 建索引期間沒有改選其他檔案
+                self.update_sheet_menu(menu, var, index.sheet_names, index)
+
+        threading.Thread(target=build, daemon=True).start()
 
     def load_recipients(self):
         path = filedialog.askopenfilename(
@@ -732,6 +3730,7 @@ class GUI:
             self.recipient_label.set(Path(path).name)
             sheets = get_excel_sheets(path)
             self.update_sheet_menu(self.recipient_sheet_menu, self.recipient_sheet_var, sheets)
+            self.index_workbook(path, self.recipient_sheet_menu, self.recipient_sheet_var)
 
     def load_exclusions(self):
         path = filedialog.askopenfilename(
@@ -742,9 +3741,12 @@ class GUI:
             self.exclusion_label.set(Path(path).name)
             sheets = get_excel_sheets(path)
             self.update_sheet_menu(self.exclusion_sheet_menu, self.exclusion_sheet_var, sheets)
+            self.index_workbook(path, self.exclusion_sheet_menu, self.exclusion_sheet_var)
 
     def load_msg_template(self):
-        path = filedialog.askopenfilename(filetypes=[("MSG Files", "*.msg")])
+        path = filedialog.askopenfilename(
+            filetypes=[("MSG Files", "*.msg"), ("HTML", "*.html *.htm")]
+        )
         if path:
             self.msg_template = path
             self.template_label.set(Path(path).name)
@@ -753,14 +3755,14 @@ class GUI:
         if self.log_window and self.log_window.winfo_exists():
             self.log_window.lift()
             return
-        self.log_window = Toplevel(self.root)
+        self.log_window = tk.Toplevel(self.root)
         self.log_window.title("🪵 日誌紀錄")
 
-        frame = Frame(self.log_window)
+        frame = tk.Frame(self.log_window)
         frame.pack(fill="both", expand=True)
 
-        self.log_text = Text(frame, wrap="word", font=("Courier", 9))
-        scrollbar = Scrollbar(frame, command=self.log_text.yview)
+        self.log_text = tk.Text(frame, wrap="word", font=("Courier", 9))
+        scrollbar = tk.Scrollbar(frame, command=self.log_text.yview)
         self.log_text.configure(yscrollcommand=scrollbar.set)
 
         self.log_text.grid(row=0, column=0, sticky="nsew")
@@ -769,11 +3771,14 @@ class GUI:
         frame.grid_rowconfigure(0, weight=1)
         frame.grid_columnconfigure(0, weight=1)
 
-        for msg in self.log_buffer:
-            self.log_text.insert(END, msg + "\n")
+        with self.log_lock:
+            self.log_pending.clear()  # 已在 log_buffer 中，避免下次 flush 重複寫入
+            text = "".join(msg + "\n" for msg in self.log_buffer)
+        self.log_text.insert(tk.END, text)
+        self.log_text.see(tk.END)
         self.log_text.config(state="disabled")
 
-        clear_btn = Button(
+        clear_btn = tk.Button(
             frame,
             text="🧹清空",
             command=self.clear_log,
@@ -783,42 +3788,51 @@ class GUI:
         clear_btn.place(relx=1.0, rely=0.0, anchor="ne", x=1, y=0)
 
     def clear_log(self):
-        self.log_buffer.clear()
-        if (
-            self.log_window
-            and hasattr(self, "log_text")
-            and self.log_window.winfo_exists()
-        ):
+        with self.log_lock:
+            self.log_buffer.clear()
+            self.log_pending.clear()
+        if self.log_window_open():
             self.log_text.config(state="normal")
-            self.log_text.delete("1.0", END)
+            self.log_text.delete("1.0", tk.END)
             self.log_text.config(state="disabled")
-        with open(LOG_FILE, "w") as f:
-            f.write("")
+        rollover_log()
         self.log("🧹 日誌已清空")
 
-    def log(self, msg):
-        logging.info(msg)
-        self.log_buffer.append(msg)
-        if (
+    def log_window_open(self):
+        return bool(
             self.log_window
             and hasattr(self, "log_text")
             and self.log_window.winfo_exists()
-        ):
-
-            def append_log():
-                self.log_text.config(state="normal")
-                self.log_text.insert(END, msg + "\n")
-                self.log_text.see(END)
-                self.log_text.config(state="disabled")
+        )
 
-            self.root.after(0, append_log)
+    def log(self, msg):
+        """可從任何執行緒呼叫；視窗更新交給 flush_log 批次處理。"""
+        logging.info(msg)
+        with self.log_lock:
+            self.log_buffer.append(msg)
+            self.log_pending.append(msg)
+
+    def flush_log(self):
+        """每 LOG_FLUSH_MS 把累積的新行一次寫入日誌視窗。"""
+        with self.log_lock:
+            lines = list(self.log_pending)
+            self.log_pending.clear()
+        if lines and self.log_window_open():
+            self.log_text.config(state="normal")
+            self.log_text.insert(tk.END, "".join(msg + "\n" for msg in lines))
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - LOG_BUFFER_LINES
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+            self.log_text.config(state="disabled")
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
 
     def start_process(self):
         # ─── 重新開始時，要先重置進度標籤與進度條 ───
         self.progress_label.set("")
         self.progress_bar["value"] = 0
 
-        user_input = self.closing_text.get("1.0", END).strip().splitlines()
+        user_input = self.closing_text.get("1.0", tk.END).strip().splitlines()
         self.closing_statements = [line.strip() for line in user_input if line.strip()]
         if not self.recipient_file or not self.msg_template:
             messagebox.showerror("錯誤", "請選擇收件人清單和郵件範本")
@@ -839,11 +3853,51 @@ class GUI:
         else:
             real_attachments = []
 
+        # 計算名單列數與最佳化圖片可能要好幾秒，放到背景執行緒，完成後才顯示確認對話框
+        self.start_button.config(state="disabled")
+        self.progress_label.set("⏳ 準備中…")
+        sheet = self.recipient_sheet_var.get()
+
+        def prepare():
+            try:
+                count = count_recipients(self.recipient_file, sheet)
+            except Exception:
+                count = None  # 名單有誤時由寄送流程回報
+            sizes = None
+            if embedded_images and self.tuning["image_max_width"]:
+                # 先最佳化一次讓對話框顯示大小；寄送時會直接命中快取
+                try:
+                    _, before, after = optimize_images(
+                        embedded_images,
+                        self.tuning["image_max_width"],
+                        self.tuning["image_quality"],
+                        self.log,
+                    )
+                    sizes = (before, after)
+                except Exception as e:
+                    self.log(f"⚠️ 圖片最佳化失敗：{e}")
+            self.root.after(
+                0,
+                lambda: self.confirm_and_start(
+                    embedded_images, real_attachments, count, sizes
+                ),
+            )
+
+        threading.Thread(target=prepare, daemon=True).start()
+
+    def confirm_and_start(self, embedded_images, real_attachments, count, sizes):
+        self.start_button.config(state="normal")
+        self.progress_label.set("")
         embed_list = (
             "\n".join([f"- {cid} → {p.name}" for cid, p in embedded_images.items()])
             or "無"
         )
+        if sizes is not None:
+            embed_list += f"\n（{image_savings_text(*sizes, count)}）"
         attachment_list = "\n".join([f"- {p.name}" for p in real_attachments]) or "無"
+        recipient_disp = Path(self.recipient_file).name
+        if count is not None:
+            recipient_disp += f"（{count:,} 列）"
         statement_list = "\n".join(self.closing_statements)
         if self.backend_var.get() == "Outlook":
             account_disp = self.account_var.get()
@@ -853,6 +3907,7 @@ class GUI:
 
 寄件帳戶：{account_disp}
 寄件後端：{self.backend_var.get()}
+收件人清單：{recipient_disp}
 
 嵌入圖片:
 {embed_list}
@@ -884,6 +3939,11 @@ class GUI:
         self.cancel_button.grid()  # 從隱藏狀態恢復
         self.save_button.grid_remove()
 
+        # 背景執行緒只更新 progress_channel，由 Tk 主迴圈定時讀取並顯示
+        self.progress_channel.reset()
+        self.progress_version = 0
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+
         # 啟動背景執行緒，傳入 pause_event 和 cancel_event
         threading.Thread(
             target=run_automailer,
@@ -894,13 +3954,13 @@ class GUI:
                 self.recipient_sheet_var.get(),
                 self.exclusion_sheet_var.get(),
                 self.msg_template,
-                self.update_progress,
+                self.progress_channel.update,
                 self.log,
                 embedded_images,  # ← 改傳「最終 dict」
                 real_attachments,  # ← 改傳「最終 list」
                 self.pause_event,
                 self.cancel_event,
-                self.on_finish,
+                self.progress_channel.finish,
                 self.account_var.get(),
                 self.backend_var.get(),
                 self.smtp_host.get(),
@@ -909,9 +3969,19 @@ class GUI:
                 self.smtp_pass.get(),
                 self.closing_statements,
             ),
+            kwargs={
+                **self.tuning,
+                "resume": self.resume_var.get(),
+                "rebuild_suppression": self.rebuild_suppression_var.get(),
+                "error_callback": self.show_error,
+            },
             daemon=True,
         ).start()
 
+    def show_error(self, title, message):
+        """可從背景執行緒呼叫；交給 Tk 主執行緒顯示錯誤對話框。"""
+        self.root.after(0, lambda: messagebox.showerror(title, message))
+
     def toggle_pause(self):
         """切換暫停 / 繼續 狀態，並更新按鈕文字。"""
         if self.pause_event.is_set():
@@ -951,7 +4021,7 @@ class GUI:
             "recipient_sheet": self.recipient_sheet_var.get(),
             "exclusion_sheet": self.exclusion_sheet_var.get(),
             "msg_template": self.msg_template,
-            "closing_statements": self.closing_text.get("1.0", END).strip().splitlines(),
+            "closing_statements": self.closing_text.get("1.0", tk.END).strip().splitlines(),
         }
                 # 根據目前的「選取模式」決定要寫哪一組鍵
         if self.folder_mode:
@@ -962,25 +4032,46 @@ class GUI:
             # ㈡ 多檔案模式 → 只保留 *_files，完全省略 _dir
             data["embed_files"] = [str(p) for p in self.embed_paths.values()]
             data["attachment_files"] = [str(p) for p in self.attachments]
-            
+        data.update(self.tuning)
         save_settings_file(data)
         self.log("✅ 設定已儲存")
         messagebox.showinfo("設定", "設定已儲存")
 
-    def update_progress(self, index, total, current_email):
-        pct = int((index + 1) / total * 100)
-        self.progress_label.set(f"{pct}% - 處理 {index + 1}/{total}: {current_email}")
+    def poll_progress(self):
+        """在 Tk 主執行緒定時顯示進度；流程結束後停止輪詢。"""
+        snap = self.progress_channel.snapshot()
+        if snap["finished"]:
+            self.on_finish(snap["last_index"], snap["total"], snap["failed"])
+            return
+        if snap["version"] != self.progress_version and snap["last_index"] is not None:
+            self.progress_version = snap["version"]
+            self.update_progress(snap)
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+
+    def update_progress(self, snap):
+        # 串流讀取時 total 是估計值，避免超過 100%
+        position = snap["last_index"] + 1
+        total = snap["total"]
+        pct = min(100, int(position / max(total, 1) * 100))
+        rate = f"{snap['rate']:.1f}" if snap["rate"] is not None else "--"
+        status = f"{pct}% - 處理 {position}/{total}: {snap['current']}"
+        status += f"\n⚡ {rate} 封/秒 ・ 剩餘 {format_duration(snap['eta'])}"
+        if snap["failed"]:
+            status += f" ・ 失敗 {snap['failed']}"
+        self.progress_label.set(status)
         self.progress_bar["value"] = pct
-        self.root.update_idletasks()
 
-    def on_finish(self, last_index, total):
+    def on_finish(self, last_index, total, failed=0):
         """流程跑完後，把暫停與取消按鈕隱藏掉。"""
         self.pause_button.grid_remove()
         self.cancel_button.grid_remove()
         self.save_button.grid()
         # 可以更新進度文字表達「已完成」：
         finished_count = last_index + 1 if last_index is not None else total
-        self.progress_label.set(f"✅ 全部寄送完成 {finished_count}/{total}")
+        status = f"✅ 全部寄送完成 {finished_count}/{total}"
+        if failed:
+            status += f"（失敗 {failed}）"
+        self.progress_label.set(status)
         
 # ─────────────────────────────
 # 🚀 Email Sending Logic
@@ -1006,56 +4097,178 @@ def run_automailer(
     smtp_user,
     smtp_pass,
     closing_statements,
+    smtp_max_per_connection=SMTP_MAX_PER_CONNECTION,
+    smtp_starttls=True,
+    smtp_async=False,
+    smtp_accounts=(),
+    smtp_batch_rcpt=SMTP_BATCH_RCPT,
+    send_workers=SEND_WORKERS,
+    render_processes=RENDER_PROCESSES,
+    rate_per_second=RATE_PER_SECOND,
+    rate_per_minute=RATE_PER_MINUTE,
+    retry_attempts=RETRY_ATTEMPTS,
+    retry_base_seconds=RETRY_BASE_SECONDS,
+    dead_letter_dir=DEAD_LETTER_DIR,
+    suppression_dir=SUPPRESSION_DIR,
+    journal_dir=JOURNAL_DIR,
+    metrics_dir=METRICS_DIR,
+    metrics_interval=METRICS_INTERVAL,
+    image_max_width=IMAGE_MAX_WIDTH,
+    image_quality=IMAGE_QUALITY,
+    resume=False,
+    rebuild_suppression=False,
+    error_callback=None,
+    metrics=None,
 ):
 
+    metrics = metrics or Metrics()
+    load_started = time.perf_counter()
     use_outlook = backend_type != "SMTP"
-    if use_outlook:
-        pythoncom.CoInitialize()
-        backend = OutlookBackend(send_account_name)
-    else:
-        backend = SmtpBackend(smtp_host, int(smtp_port or 0), smtp_user, smtp_pass)
-
+    # Outlook 的 COM 物件不能跨執行緒共用，只開一個工作執行緒
+    send_workers = 1 if use_outlook else max(1, int(send_workers))
+    # 多帳號只用在寄出；存稿一律寫進同一個 mbox
+    use_accounts = not use_outlook and mode == "send" and bool(smtp_accounts)
+    use_async = not use_outlook and not use_accounts and bool(smtp_async)
+    # 先讀名單：名單有誤就直接結束，不必建立（再關閉）寄送後端
     try:
-        recipients = load_recipients_or_csv(
-            recipients_path,
-            visible_only=True,
-            sheet_name=recipients_sheet if recipients_sheet != ALL_SHEETS else ALL_SHEETS,
+        recipients = iter_recipients(
+            recipients_path, visible_only=True, sheet_name=recipients_sheet
         )
-        validate_recipient_columns(recipients)
-    except ValueError as e:
-        messagebox.showerror("檔案錯誤", str(e))
+        validate_recipient_columns(recipients.columns)
+    except Exception as e:  # 也包含 XML 解析錯誤與找不到檔案
+        if error_callback:
+            error_callback("檔案錯誤", str(e))
         logger(f"收件人清單錯誤: {e}")
         if finish_callback:
             finish_callback(None, 0)
         return
-    exclusion_emails = []
-    if exclusion_path and os.path.exists(exclusion_path):
-        try:
-            exclusion_df = load_recipients_or_csv(
-                exclusion_path, sheet_name=exclusion_sheet if exclusion_sheet != ALL_SHEETS else ALL_SHEETS
-            )
-            exclusion_emails = exclusion_df["Email"].tolist()
-        except Exception as e:
-            logger(f"排除清單讀取失敗: {e}")
-    filtered = recipients[~recipients["Email"].isin(exclusion_emails)]
 
-    msg = extract_msg.Message(msg_template_path)
-    subject = msg.subject
+    # 排除清單會累積進本機的永久索引，之後每次寄送都會套用；要重來就先清空
+    suppression = None
     try:
-        raw_html_body = msg.htmlBody
-    except UnicodeDecodeError as e:
-        logger(f"HTML 解析失敗: {e}")
-        raw_html_body = None
-    html_body = (
-        raw_html_body.decode("utf-8", errors="ignore")
-        if isinstance(raw_html_body, bytes)
-        else (raw_html_body or "")
+        suppression = SuppressionIndex(get_base_dir() / suppression_dir)
+        if rebuild_suppression:
+            suppression.clear()
+            logger("🧹 已清空排除索引，只保留這次選擇的排除清單")
+        if exclusion_path and os.path.exists(exclusion_path):
+            added = suppression.add_file(exclusion_path, exclusion_sheet)
+            logger(f"🚫 排除索引新增 {added} 筆，共 {len(suppression)} 筆")
+    except Exception as e:
+        # 排除清單沒套用就不能寄：寧可中止，也不要寄給使用者排除的地址
+        if suppression is not None:
+            suppression.close()
+        if error_callback:
+            error_callback("檔案錯誤", f"排除清單讀取失敗：{e}")
+        logger(f"排除清單讀取失敗: {e}")
+        if finish_callback:
+            finish_callback(None, 0)
+        return
+
+    try:
+        subject, html_body, tokens = read_msg_template(msg_template_path, logger)
+    except Exception as e:  # 找不到檔案或不是有效的 .msg
+        if suppression is not None:
+            suppression.close()
+        if error_callback:
+            error_callback("檔案錯誤", str(e))
+        logger(f"郵件範本錯誤: {e}")
+        if finish_callback:
+            finish_callback(None, 0)
+        return
+    if embedded_images and image_max_width:
+        embedded_images, before, after = optimize_images(
+            embedded_images, image_max_width, image_quality, logger
+        )
+        if after < before:
+            savings = image_savings_text(before, after, recipients.estimated_total)
+            logger(f"🖼 圖片最佳化：{savings}")
+
+    try:
+        journal = SendJournal(
+            SendJournal.campaign_path(
+                get_base_dir() / journal_dir,
+                recipients_path,
+                recipients_sheet,
+                msg_template_path,
+                mode,
+            ),
+            resume=resume,
+        )
+    except (OSError, sqlite3.Error) as e:  # 資料夾無法寫入、資料庫被鎖住或損毀
+        if suppression is not None:
+            suppression.close()
+        if error_callback:
+            error_callback("檔案錯誤", str(e))
+        logger(f"寄送紀錄開啟失敗: {e}")
+        if finish_callback:
+            finish_callback(None, 0)
+        return
+    if resume:
+        logger(f"⏭ 續寄：略過 {len(journal.delivered)} 位已寄出的收件人")
+
+    columns = recipients.columns
+    template = MessageTemplate(
+        html_body, columns, embedded_images, logger, tokens=tokens
     )
+    email_col = columns.index("Email")
+    salutation_col = columns.index("Salutation")
+    attachment_bytes = sum(file_size(p) for p in real_attachments)
+    metrics.observe("load", time.perf_counter() - load_started)
+
+    metrics_path = get_base_dir() / metrics_dir if metrics_dir else None
+    metrics_stop = threading.Event()
+    if metrics_path is not None and float(metrics_interval) > 0:
+        metrics.export_every(metrics_path, float(metrics_interval), metrics_stop)
 
-    cid_list = list(embedded_images)
-    image_html_all = generate_image_html(cid_list)
+    # 名單是邊讀邊寄的，總數只是估計值（供進度顯示）
+    total = recipients.estimated_total
 
-    total = len(filtered)
+    # 名單與範本都準備好才建立寄送後端，前面出錯時不會留下連線池或事件迴圈執行緒
+    if use_outlook:
+        smtp_backend = None
+    elif use_accounts:
+        smtp_backend = ShardedBackend(
+            smtp_accounts,
+            {
+                "host": smtp_host,
+                "port": smtp_port,
+                "user": smtp_user,
+                "pass": smtp_pass,
+                "starttls": smtp_starttls,
+                "max_per_connection": smtp_max_per_connection,
+                "rate_per_second": rate_per_second,
+                "rate_per_minute": rate_per_minute,
+            },
+            cancel_event,
+            logger,
+            state_path=get_base_dir() / QUOTA_FILE,
+            metrics=metrics,
+        )
+        # 每個帳號各有自己的並行數與限速
+        send_workers = smtp_backend.workers
+        logger(f"🔀 使用 {len(smtp_backend.accounts)} 個寄件帳號，共 {send_workers} 條連線")
+    elif use_async:
+        # send_workers 個連線共用同一個事件迴圈，不必每條連線一個執行緒
+        smtp_backend = AsyncSmtpBackend(
+            smtp_host,
+            int(smtp_port or 0),
+            smtp_user,
+            smtp_pass,
+            max_per_connection=smtp_max_per_connection,
+            metrics=metrics,
+            starttls=smtp_starttls,
+            max_sessions=send_workers,
+        )
+    else:
+        smtp_backend = SmtpBackend(
+            smtp_host,
+            int(smtp_port or 0),
+            smtp_user,
+            smtp_pass,
+            max_per_connection=smtp_max_per_connection,
+            metrics=metrics,
+            starttls=smtp_starttls,
+        )
 
     """
     新增參數 cancel_event。每次迴圈開始前或 pause 時，都要檢查 cancel_event 
@@ -1063,73 +4276,653 @@ def run_automailer(
     新增一個參數 pause_event：threading.Event 物件。
     在每次實際要發送/存稿之前，都先呼叫 pause_event.wait()。
     當 pause_event 被 clear 時，wait() 會阻塞；被 set 時繼續執行。
+
+    產生端（本執行緒）負責套版，把訊息放進有上限的佇列；send_workers 個
+    工作執行緒各自取出寄送（SMTP 由連線池讓每個執行緒使用自己的連線），
+    進度回報則依原始順序送出。
     """
-    last_index = None
-    for i, row in filtered.iterrows():
-        last_index = i
-        # 若使用者按了「取消」，就直接跳出
-        if cancel_event.is_set():
-            logger("❌ 停止寄送，使用者已取消")
-            break
+    jobs = queue.Queue(maxsize=send_workers * SEND_QUEUE_PER_WORKER)
+    # 存稿只寫本機（或 Outlook 草稿匣），不需要限速
+    limiter = (
+        RateLimiter(float(rate_per_second), float(rate_per_minute))
+        if mode == "send" and not use_accounts
+        else None
+    )
+    progress = _OrderedProgress(progress_update)
+    retries = RetryQueue()
+    attempts = {}  # 列號 → 已重寄次數
+    retry_attempts = max(0, int(retry_attempts or 0))
+    dead_letters = DeadLetterFile(
+        get_base_dir()
+        / dead_letter_dir
+        / time.strftime(f"{Path(recipients_path).stem}-%Y%m%d-%H%M%S.csv"),
+        columns,
+    )
 
-        # 暫停處理：若 pause_event 沒被 set，就持續小睡並每次檢查 cancel_event
-        while not pause_event.is_set():
+    def may_send():
+        """等暫停解除與限速放行；期間被取消則回傳 False。"""
+        if not wait_if_paused(pause_event, cancel_event):
+            return False
+        if limiter is None:
+            return True
+        with metrics.time("throttle"):
+            return limiter.acquire(cancel_event)
+
+    # 每個 job 是 (內文, [(seq, 列號, 收件人, 稱呼, 結尾詞, 列資料, ticket), …])；
+    # 合併寄送時同一筆交易會有多位收件人
+    def report_sent(member, response):
+        seq, i, recipient, salutation, statement = member[:5]
+        attempts.pop(i, None)
+        metrics.add("messages_sent")
+        metrics.add("attachment_bytes", attachment_bytes)
+        journal.mark(recipient, i, "sent", response)
+        logger(f"✉ 已處理：{recipient} / {salutation} / {statement}")
+        progress.done(seq, (i, total, recipient))
+        retries.settled()
+        if limiter is not None:
+            limiter.succeeded()
+
+    def report_failed(body, member, e, count_throttle=True):
+        seq, i, recipient = member[:3]
+        if isinstance(e, SendCancelled):
+            report_skipped(member)
+            return
+        if count_throttle and limiter is not None and is_throttling_error(e):
+            limiter.throttled()
+            logger(f"⏳ 伺服器節流，暫緩寄送：{e}")
+        retryable = is_retryable_error(e)
+        attempt = attempts.get(i, 0) + 1
+        exhausted = retryable and attempt > retry_attempts
+        if retryable and not exhausted and not cancel_event.is_set():
+            # 暫時性錯誤：退避後再排進佇列，這段期間其他收件人照常寄送
+            attempts[i] = attempt
+            delay = retry_delay(attempt, retry_base_seconds)
+            metrics.add("messages_retried")
+            journal.mark(recipient, i, "retry", str(e))
+            logger(
+                f"🔁 {delay:.0f} 秒後重寄（第 {attempt}/{retry_attempts} 次）："
+                f"{recipient} - {e}"
+            )
+            retries.push(delay, (body, member))
+            # 重寄時會拿到新的進度序號
+            progress.done(seq)
+            retries.settled()
+            return
+        attempts.pop(i, None)
+        metrics.add("messages_failed")
+        journal.mark(recipient, i, "failed", str(e))
+        logger(f"❌ 寄送失敗：{recipient} - {e}")
+        if exhausted:
+            dead_letters.add(member[5], e)
+        progress.done(seq, (i, total, f"{recipient} ❌"))
+        retries.settled()
+
+    def report_skipped(member):
+        journal.mark(member[2], member[1], "skipped")
+        progress.done(member[0])
+        retries.settled()
+
+    def report_result(body, members, result=None, error=None):
+        if error is not None:
+            # 整筆交易失敗只算一次節流
+            for k, member in enumerate(members):
+                report_failed(body, member, error, count_throttle=k == 0)
+            return
+        response, refused = result
+        for member in members:
+            if member[2] in refused:
+                report_failed(
+                    body,
+                    member,
+                    smtplib.SMTPRecipientsRefused({member[2]: refused[member[2]]}),
+                )
+            else:
+                report_sent(member, response)
+
+    def ready_members(members):
+        """逐位等暫停解除與限速放行；被取消的標記為略過。"""
+        ready = []
+        for member in members:
+            if may_send():
+                ready.append(member)
+            else:
+                report_skipped(member)
+        return ready
+
+    def worker():
+        backend = None
+        backend_error = None
+        try:
+            if use_outlook:
+                pythoncom.CoInitialize()
+                backend = OutlookBackend(send_account_name)
+            else:
+                backend = smtp_backend
+        except Exception as e:
+            backend_error = e
+            logger(f"❌ 寄信後端初始化失敗：{e}")
+
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            body, members = job
+            members = ready_members(members)
+            if not members:
+                continue
+            try:
+                if backend is None:
+                    raise backend_error
+                for member in members:
+                    journal.ensure(member[-1])
+                with metrics.time("send"):
+                    if len(members) == 1:
+                        result = (
+                            backend.send(
+                                mode,
+                                members[0][2],
+                                subject,
+                                body,
+                                embedded_images,
+                                real_attachments,
+                            ),
+                            {},
+                        )
+                    else:
+                        result = backend.send_batch(
+                            mode,
+                            [member[2] for member in members],
+                            subject,
+                            body,
+                            embedded_images,
+                            real_attachments,
+                        )
+            except Exception as e:
+                report_result(body, members, error=e)
+            else:
+                report_result(body, members, result)
+
+        if use_outlook:
+            pythoncom.CoUninitialize()
+
+    def dispatcher():
+        """非同步後端：單一執行緒把信交給事件迴圈，最多 send_workers 筆同時在途。"""
+        in_flight = threading.BoundedSemaphore(send_workers)
+
+        def take_slot():
+            while not in_flight.acquire(timeout=0.1):
+                if cancel_event.is_set():
+                    return False
+            return True
+
+        def on_done(future, body, members, started):
+            metrics.observe("send", time.perf_counter() - started)
+            in_flight.release()
+            try:
+                result = future.result()
+            except Exception as e:
+                report_result(body, members, error=e)
+            else:
+                report_result(body, members, result)
+
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            body, members = job
+            members = ready_members(members)
+            if not members:
+                continue
+            if not take_slot():
+                for member in members:
+                    report_skipped(member)
+                continue
+            for member in members:
+                journal.ensure(member[-1])
+            started = time.perf_counter()
+            try:
+                if len(members) == 1:
+                    future = smtp_backend.submit(
+                        mode, members[0][2], subject, body, embedded_images, real_attachments
+                    )
+                else:
+                    future = smtp_backend.submit_batch(
+                        mode,
+                        [member[2] for member in members],
+                        subject,
+                        body,
+                        embedded_images,
+                        real_attachments,
+                    )
+            except Exception as e:
+                in_flight.release()
+                report_result(body, members, error=e)
+                continue
+            future.add_done_callback(
+                lambda f, body=body, members=members, started=started: on_done(
+                    f, body, members, started
+                )
+            )
+
+        # 等所有在途的信寄完
+        for _ in range(send_workers):
+            in_flight.acquire()
+
+    if use_async:
+        threads = [threading.Thread(target=dispatcher, daemon=True)]
+    else:
+        threads = [
+            threading.Thread(target=worker, daemon=True) for _ in range(send_workers)
+        ]
+    for t in threads:
+        t.start()
+
+    # 只有 SMTP 寄出才合併：草稿是一人一封，Outlook 與多帳號分流則逐封寄送
+    batch_rcpt = int(smtp_batch_rcpt or 0)
+    if batch_rcpt > 1 and (mode != "send" or use_outlook or use_accounts):
+        batch_rcpt = 1
+    pending = {}  # 內文 → 等待合併的收件人（依第一位的列號排序）
+    seq = 0
+
+    def enqueue(body, group):
+        """替一組收件人編上進度序號後放進佇列；被取消則標記為略過。"""
+        nonlocal seq
+        members = [(seq + k, *member) for k, member in enumerate(group)]
+        seq += len(members)
+        retries.started(len(members))
+        if put_unless_cancelled(jobs, (body, members), cancel_event):
+            return True
+        for member in members:
+            report_skipped(member)
+        return False
+
+    def enqueue_due_retries():
+        for body, member in retries.pop_due():
+            _, i, recipient, salutation, statement, values, _ = member
+            ticket = journal.mark(recipient, i, "in_flight")
+            if not enqueue(body, [(i, recipient, salutation, statement, values, ticket)]):
+                return False
+        return True
+
+    rows = iter(recipients)
+
+    # 大名單時把套版與 HTML 分段的 MIME 編碼交給行程池，寄送端只搬位元組
+    processes = int(render_processes or 0)
+    if processes <= 0:
+        cpus = os.cpu_count() or 1
+        processes = cpus if cpus > 1 and total >= RENDER_POOL_MIN_ROWS else 1
+    render_pool = None
+    if processes > 1:
+        try:
+            # 這時已有日誌、寄送等執行緒在跑，fork 可能複製到被鎖住的鎖，改用 spawn
+            render_pool = futures.ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_render_worker,
+                initargs=(template, not use_outlook),
+            )
+        except (OSError, NotImplementedError, ValueError) as e:
+            logger(f"⚠️ 無法啟動套版行程，改在本執行緒套版：{e}")
+        else:
+            logger(f"🧩 以 {processes} 個行程套版")
+
+    def candidates():
+        """讀名單、略過排除與已寄出的收件人，產生 (列號, 收件人, 列資料, 結尾詞)。"""
+        for i in itertools.count():
+            with metrics.time("read"):
+                values = next(rows, None)
+            if values is None:
+                return
+            # 若使用者按了「取消」，就直接停止
             if cancel_event.is_set():
                 logger("❌ 停止寄送，使用者已取消")
+                return
+            recipient = cell_text(values[email_col]).strip()
+            if suppression is not None and recipient in suppression:
+                continue
+            if recipient in journal.delivered:
+                continue
+            yield i, recipient, values, random.choice(closing_statements)
+
+    def render_here(items):
+        """在本執行緒套版；失敗的列以例外取代內文。"""
+        for item in items:
+            try:
+                with metrics.time("render"):
+                    body = template.render(item[2], item[3])
+            except Exception as e:
+                body = e
+            yield (*item, body)
+
+    def render_in_pool(items):
+        """分批交給套版行程並依原順序取回；預先套版的批數有上限（背壓）。"""
+        ahead = deque()
+        broken = False
+
+        def collect():
+            nonlocal broken
+            batch, future = ahead.popleft()
+            results = None
+            if not broken:
+                try:
+                    results = future.result()
+                except Exception as e:  # 行程被終止等，之後都改在本執行緒套版
+                    broken = True
+                    logger(f"⚠️ 套版行程失敗，改在本執行緒套版：{e}")
+            if results is None:
+                yield from render_here(batch)
+                return
+            for item, (body, part, seconds) in zip(batch, results):
+                metrics.observe("render", seconds)
+                if part is not None:
+                    body = RenderedHtml(body, part)
+                yield (*item, body)
+
+        items = iter(items)
+        while True:
+            batch = list(itertools.islice(items, RENDER_CHUNK_ROWS))
+            if not batch:
                 break
-            time.sleep(0.1)
-        if cancel_event.is_set():
+            if not broken:
+                try:
+                    future = render_pool.submit(
+                        _render_chunk, [(item[2], item[3]) for item in batch]
+                    )
+                except Exception as e:
+                    broken = True
+                    logger(f"⚠️ 套版行程失敗，改在本執行緒套版：{e}")
+            if broken:
+                while ahead:
+                    yield from collect()
+                yield from render_here(batch)
+                continue
+            ahead.append((batch, future))
+            if len(ahead) >= processes * RENDER_CHUNKS_PER_PROCESS:
+                yield from collect()
+        while ahead:
+            yield from collect()
+
+    if render_pool is not None:
+        rendered = render_in_pool(candidates())
+    else:
+        rendered = render_here(candidates())
+    try:
+        for i, recipient, values, statement, body in rendered:
+            if not enqueue_due_retries():
+                logger("❌ 停止寄送，使用者已取消")
+                break
+            try:
+                if isinstance(body, Exception):
+                    raise body
+                salutation = cell_text(values[salutation_col])
+            except Exception as e:
+                metrics.add("messages_failed")
+                journal.mark(recipient, i, "failed", str(e))
+                logger(f"❌ 寄送失敗：{recipient} - {e}")
+                progress.done(seq, (i, total, f"{recipient} ❌"))
+                seq += 1
+                continue
+
+            member = (
+                i, recipient, salutation, statement, values,
+                journal.mark(recipient, i, "in_flight"),
+            )
+            if batch_rcpt <= 1:
+                if not enqueue(body, [member]):
+                    logger("❌ 停止寄送，使用者已取消")
+                    break
+                continue
+            group = pending.setdefault(body, [])
+            group.append(member)
+            ready = [(body, pending.pop(body))] if len(group) >= batch_rcpt else []
+            # 等太久的群組先寄出，避免進度與記憶體被卡住
+            while pending:
+                oldest = next(iter(pending))
+                if pending[oldest][0][0] > i - BATCH_WINDOW_ROWS:
+                    break
+                ready.append((oldest, pending.pop(oldest)))
+            if not all([enqueue(*item) for item in ready]):
+                logger("❌ 停止寄送，使用者已取消")
+                break
+    except Exception as e:
+        logger(f"收件人清單錯誤: {e}")
+    finally:
+        rendered.close()
+        if render_pool is not None:
+            render_pool.shutdown(wait=True, cancel_futures=True)
+
+    # 剩下還在等待合併的群組（取消時 enqueue 會把它們標記為略過）
+    for item in list(pending.items()):
+        enqueue(*item)
+
+    # 名單讀完後繼續處理重寄，直到沒有在途或等待重寄的信
+    while not cancel_event.is_set():
+        enqueue_due_retries()
+        if not retries.wait(0.5):
             break
-
+    abandoned = retries.drain()
+    if abandoned:
+        logger(f"⏭ 已取消，{len(abandoned)} 位等待重寄的收件人未寄出（可用續寄補寄）")
+
+    for _ in threads:
+        jobs.put(None)
+    for t in threads:
+        t.join()
+
+    if smtp_backend is not None:
+        smtp_backend.close()
+    if suppression is not None:
+        suppression.close()
+    journal.close()
+    dead_letters.close()
+    if dead_letters.count:
+        logger(f"📮 {dead_letters.count} 位收件人重寄後仍失敗，已寫入 {dead_letters.path}")
+    metrics_stop.set()
+    if metrics_path is not None:
         try:
-            recipient = row["Email"]
-            salutation = row["Salutation"]
-            statement = random.choice(closing_statements)
+            metrics.export(metrics_path)
+        except OSError as e:
+            logger(f"⚠️ 無法輸出效能統計：{e}")
+    logger("✅ 所有郵件處理完成")
 
-            body = html_body.replace("[salutation]", salutation).replace(
-                "[statement]", statement
-            )
+    if finish_callback:
+        finish_callback(progress.last_index, total)
 
-            def repl(match):
-                idx = match.group(1)
-                if idx == "":
-                    return image_html_all
-                try:
-                    index = int(idx) - 1  # 讓 [image1] 代表第一張圖
-                    if index < 0:
-                        raise IndexError
-                    cid = cid_list[index]
-                    return generate_image_html([cid])
-                except (ValueError, IndexError):
-                    logger(f"⚠️ 無效的圖片佔位符：[image{idx}] → 找不到對應圖片")
-                    return ""
+# ─────────────────────────────
+# 🖧 Headless CLI
+# ─────────────────────────────
+class JsonLinesReporter:
+    """Writes progress and log events to a stream as one JSON object per line."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+        self.channel = ProgressChannel()
+        self.errors = 0
+
+    @property
+    def failed(self):
+        return self.channel.failed
+
+    def emit(self, event, **fields):
+        line = json.dumps({"event": event, "time": time.time(), **fields},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
 
-            body = re.sub(r"\[image(\d*)\]", repl, body)
+    def log(self, msg):
+        logging.info(msg)
+        self.emit("log", message=msg)
+
+    def progress(self, index, total, current_email):
+        self.channel.update(index, total, current_email)
+        snap = self.channel.snapshot()
+        self.emit(
+            "progress",
+            index=index,
+            total=total,
+            recipient=current_email.removesuffix(" ❌"),
+            ok=not current_email.endswith(" ❌"),
+            done=snap["done"],
+            failed=snap["failed"],
+            rate=snap["rate"] and round(snap["rate"], 2),
+            eta=snap["eta"] and round(snap["eta"], 1),
+        )
 
-            backend.send(
-                mode,
-                recipient,
-                subject,
-                body,
-                embedded_images,
-                real_attachments,
-            )
-            logger(f"✉ 已處理：{recipient} / {salutation} / {statement}")
-            progress_update(i, total, recipient)
-            time.sleep(DELAY_SEND if mode == "send" else DELAY_DRAFT)
-        except Exception as e:
-            logger(f"❌ 寄送失敗：{recipient} - {e}")
-            progress_update(i, total, f"{recipient} ❌")
+    def error(self, title, message):
+        self.errors += 1
+        self.emit("error", title=title, message=message)
+
+    def finish(self, last_index, total):
+        self.channel.finish(last_index, total)
+        snap = self.channel.snapshot()
+        self.emit(
+            "finish",
+            last_index=last_index,
+            total=total,
+            done=snap["done"],
+            failed=snap["failed"],
+            elapsed=round(snap["elapsed"], 2),
+        )
 
-    logger("✅ 所有郵件處理完成")
 
-    if finish_callback:
-        finish_callback(last_index, total)
-        
-    if use_outlook:
-        pythoncom.CoUninitialize()
+def build_cli_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="automailer",
+        description="不開 GUI，以 SMTP 批次寄信；進度以 JSON Lines 輸出到 stdout。"
+        "未指定的參數沿用 settings.json。",
+    )
+    parser.add_argument("--settings", default=str(SETTINGS_FILE),
+                        help="設定檔路徑（預設為程式目錄的 settings.json）")
+    parser.add_argument("--recipients", help="收件人清單（.csv/.xlsx/.xls）")
+    parser.add_argument("--sheet", help="收件人工作表；預設整本活頁簿")
+    parser.add_argument("--exclusion", help="排除清單")
+    parser.add_argument("--exclusion-sheet", help="排除清單工作表")
+    parser.add_argument("--template", help="郵件範本 .msg（或 .html，主旨取自 <title>）")
+    parser.add_argument("--mode", choices=["send", "draft"])
+    parser.add_argument("--smtp-host")
+    parser.add_argument("--smtp-port")
+    parser.add_argument("--smtp-user")
+    parser.add_argument("--smtp-pass",
+                        help="SMTP 密碼；也可用環境變數 AUTOMAILER_SMTP_PASS")
+    parser.add_argument("--embed-dir", help="嵌入圖片資料夾")
+    parser.add_argument("--attachment-dir", help="附件資料夾")
+    parser.add_argument("--closing", action="append",
+                        help="結尾詞，可重複指定多次")
+    parser.add_argument("--workers", type=int, help="同時寄送的 SMTP 連線數")
+    parser.add_argument("--render-processes", type=int,
+                        help="套版行程數（0 為大名單時自動，1 為不使用行程池）")
+    parser.add_argument("--accounts",
+                        help="多帳號設定 JSON 檔（格式同 settings.json 的 smtp_accounts）")
+    parser.add_argument("--async", dest="smtp_async", action="store_true",
+                        help="以 asyncio 後端寄送：所有連線共用一個事件迴圈並使用 PIPELINING")
+    parser.add_argument("--no-starttls", action="store_true",
+                        help="不使用 STARTTLS（僅限信任的內部轉送伺服器）")
+    parser.add_argument("--resume", action="store_true",
+                        help="從上次中斷處續寄（略過已寄出的收件人）")
+    parser.add_argument("--rebuild-suppression", action="store_true",
+                        help="清空排除索引，只保留這次指定的排除清單")
+    return parser
+
+
+def run_cli(argv=None, stream=None) -> int:
+    """Headless entry point: drives run_automailer with the SMTP backend."""
+    args = build_cli_parser().parse_args(argv)
+    setup_logging()
+    cfg = {}
+    settings_path = Path(args.settings)
+    if settings_path.exists():
+        with open(settings_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+
+    def pick(value, key, default=""):
+        return value if value is not None else (cfg.get(key) or default)
+
+    recipients = pick(args.recipients, "recipient_file")
+    template = pick(args.template, "msg_template")
+    if not recipients or not template:
+        build_cli_parser().error("需要 --recipients 與 --template（或在設定檔中指定）")
+
+    embed_dir = pick(args.embed_dir, "embed_dir")
+    if embed_dir:
+        embedded_images = load_embeds(embed_dir)
+    else:
+        embedded_images = {safe_cid(Path(p).stem): Path(p) for p in cfg.get("embed_files", [])}
+    attachment_dir = pick(args.attachment_dir, "attachment_dir")
+    if attachment_dir:
+        attachments = load_attachments(attachment_dir)
+    else:
+        attachments = [Path(p) for p in cfg.get("attachment_files", [])]
+
+    tuning = {k: cfg.get(k, v) for k, v in TUNING_DEFAULTS.items()}
+    if args.workers is not None:
+        tuning["send_workers"] = args.workers
+    if args.render_processes is not None:
+        tuning["render_processes"] = args.render_processes
+    if args.no_starttls:
+        tuning["smtp_starttls"] = False
+    if args.smtp_async:
+        tuning["smtp_async"] = True
+    if args.accounts:
+        with open(args.accounts, "r", encoding="utf-8") as f:
+            tuning["smtp_accounts"] = json.load(f)
+
+    reporter = JsonLinesReporter(stream)
+    pause_event = threading.Event()
+    pause_event.set()
+    cancel_event = threading.Event()
+
+    def on_signal(signum, frame):
+        # 只設旗標：handler 可能打斷正在 emit 的主執行緒，不能再去拿 reporter 的鎖
+        cancel_event.set()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    mode = pick(args.mode, "mode", "draft")
+    reporter.emit("start", mode=mode, recipients=recipients, template=template)
+    run_automailer(
+        mode,
+        recipients,
+        pick(args.exclusion, "exclusion_file"),
+        pick(args.sheet, "recipient_sheet", ALL_SHEETS),
+        pick(args.exclusion_sheet, "exclusion_sheet", ALL_SHEETS),
+        template,
+        reporter.progress,
+        reporter.log,
+        embedded_images,
+        attachments,
+        pause_event,
+        cancel_event,
+        reporter.finish,
+        "",
+        "SMTP",
+        pick(args.smtp_host, "smtp_host"),
+        pick(args.smtp_port, "smtp_port", "587"),
+        pick(args.smtp_user, "smtp_user"),
+        args.smtp_pass
+        or os.environ.get("AUTOMAILER_SMTP_PASS")
+        or cfg.get("smtp_pass", ""),
+        args.closing or cfg.get("closing_statements") or DEFAULT_CLOSING_STATEMENTS,
+        resume=args.resume,
+        rebuild_suppression=args.rebuild_suppression,
+        error_callback=reporter.error,
+        **tuning,
+    )
+    if cancel_event.is_set():
+        reporter.log("❌ 收到中止訊號，已停止寄送")
+        return 130
+    return 1 if reporter.errors or reporter.failed else 0
+
 
 if __name__ == "__main__":
-    root = Tk()
+    # 打包成 exe 時，套版行程會以同一個執行檔啟動，要先在這裡攔下
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    setup_logging()
+    root = tk.Tk()
     GUI(root)
     root.mainloop()
@@ -0,0 +1,121 @@
+"""Startup benchmark for automailer.
+
+Runs ``python -X importtime -c "import automailer"`` in fresh interpreters and
+reports the cumulative import time plus the slowest modules. It also checks
+that heavy or platform-specific modules stay deferred until they are needed.
+
+    python benchmarks/startup.py                  # human-readable report
+    python benchmarks/startup.py --json out.json  # also save the results
+    python benchmarks/startup.py --budget-ms 150  # exit 1 if over budget
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+# 這些模組若在 import automailer 時就被載入，代表延遲載入失效
+DEFERRED_MODULES = [
+    "pandas",
+    "numpy",
+    "extract_msg",
+    "RTFDE",
+    "tkinter",
+    "pythoncom",
+    "win32com",
+    "PIL",
+]
+DEFAULT_BUDGET_MS = 250
+DEFAULT_RUNS = 5
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """把 -X importtime 輸出解析成 {模組: (self µs, cumulative µs)}。"""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, name = fields
+        result[name.strip()] = (int(self_us), int(cumulative_us))
+    return result
+
+
+def measure_once(python: str) -> dict:
+    code = (
+        "import json, sys; import automailer; "
+        f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = parse_importtime(proc.stderr)
+    return {
+        "total_us": modules.get("automailer", (0, 0))[1],
+        "modules": modules,
+        "eager": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def run(python: str, runs: int, top: int) -> dict:
+    samples = [measure_once(python) for _ in range(runs)]
+    totals = [s["total_us"] for s in samples]
+    # 以中位數那次的明細當作代表
+    median_sample = sorted(samples, key=lambda s: s["total_us"])[len(samples) // 2]
+    slowest = sorted(
+        median_sample["modules"].items(), key=lambda item: item[1][0], reverse=True
+    )[:top]
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "median_ms": statistics.median(totals) / 1000,
+        "min_ms": min(totals) / 1000,
+        "max_ms": max(totals) / 1000,
+        "slowest_self_ms": {name: self_us / 1000 for name, (self_us, _) in slowest},
+        "eager_modules": sorted({m for s in samples for m in s["eager"]}),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--json", help="把結果寫成 JSON 檔")
+    args = parser.parse_args(argv)
+
+    report = run(args.python, args.runs, args.top)
+    report["budget_ms"] = args.budget_ms
+
+    print(f"import automailer: median {report['median_ms']:.1f} ms "
+          f"(min {report['min_ms']:.1f}, max {report['max_ms']:.1f}, "
+          f"{report['runs']} runs, budget {args.budget_ms:.0f} ms)")
+    print("slowest modules (self time):")
+    for name, ms in report["slowest_self_ms"].items():
+        print(f"  {ms:8.2f} ms  {name}")
+    if report["eager_modules"]:
+        print("❌ imported at startup but should be deferred: "
+              + ", ".join(report["eager_modules"]))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    over_budget = report["median_ms"] > args.budget_ms
+    if over_budget:
+        print("❌ startup time is over budget")
+    return 1 if over_budget or report["eager_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
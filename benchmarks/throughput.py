@@ -0,0 +1,560 @@
+"""Throughput benchmark for automailer.
+
+Generates synthetic recipient lists (CSV, or XLSX with hidden rows), template
+and attachment fixtures, then runs ``run_automailer`` end to end against an
+in-process SMTP sink. Every scenario runs in a fresh child process, and the
+report covers messages/s, peak RSS and per-phase time.
+
+    python benchmarks/throughput.py                               # 1k rows, CSV + XLSX
+    python benchmarks/throughput.py --scale 100k --workers 1,4
+    python benchmarks/throughput.py --latency-ms 20 --throttle-every 500
+    python benchmarks/throughput.py --async --workers 16 --latency-ms 20
+    python benchmarks/throughput.py --accounts 4 --workers 2 --latency-ms 20
+    python benchmarks/throughput.py --template generic --batch-rcpt 50
+    python benchmarks/throughput.py --json new.json --baseline old.json
+
+The sink can simulate per-message latency, a throttling reply every N
+messages (``--throttle-code``, 451 by default) and dropped connections.
+Fixtures are cached in ``benchmarks/.data``.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+SCALES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+HIDDEN_EVERY = 10  # XLSX 每 10 列隱藏一列
+COLUMNS = ["Email", "Salutation", "Company", "City"]
+CITIES = ["Taipei", "Tokyo", "Berlin", "Austin", "Lagos", "Lima"]
+DEFAULT_MAX_REGRESSION = 10.0  # msgs/s 比基準慢超過幾 % 視為退步
+
+TEMPLATE_HTML = """<html><head><title>Quarterly update for [Company]</title></head>
+<body>
+<p>[salutation],</p>
+<p>Thank you for working with us in [City]. Here is what [Company] can expect
+this quarter.</p>
+[image1]
+<p>Regards,<br>[statement]</p>
+[image]
+</body></html>
+"""
+# 只依城市變化的通用內容：同城市的收件人會產生完全相同的信，可合併寄送
+GENERIC_TEMPLATE_HTML = """<html><head><title>News from our [City] office</title></head>
+<body>
+<p>Dear Customer,</p>
+<p>Here is this quarter's update from the [City] office.</p>
+[image1]
+<p>Regards,<br>[statement]</p>
+</body></html>
+"""
+TEMPLATES = {"personal": TEMPLATE_HTML, "generic": GENERIC_TEMPLATE_HTML}
+
+
+# ─────────────────────────────
+# 🧪 Fixtures
+# ─────────────────────────────
+def recipient_row(i: int) -> list[str]:
+    return [
+        f"user{i}@bench.example",
+        f"Dear User {i}",
+        f"Company {i % 997}",
+        CITIES[i % len(CITIES)],
+    ]
+
+
+def write_csv(path: Path, rows: int) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(COLUMNS) + "\n")
+        for i in range(rows):
+            f.write(",".join(recipient_row(i)) + "\n")
+
+
+def column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def write_xlsx(path: Path, rows: int) -> None:
+    """手寫最小的 .xlsx（inline strings），每 HIDDEN_EVERY 列隱藏一列；可串流寫出百萬列。"""
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_ns = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            "</Types>",
+        )
+        zf.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            "</Relationships>",
+        )
+        zf.writestr(
+            "xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8"?><workbook {ns} {rel_ns}>'
+            '<sheets><sheet name="Recipients" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            "</Relationships>",
+        )
+        last = column_letter(len(COLUMNS) - 1)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as f:
+            f.write(
+                f'<?xml version="1.0" encoding="UTF-8"?><worksheet {ns}>'
+                f'<dimension ref="A1:{last}{rows + 1}"/><sheetData>'.encode()
+            )
+            for r, values in enumerate(itertools.chain([COLUMNS], map(recipient_row, range(rows))), 1):
+                hidden = ' hidden="1"' if r > 1 and r % HIDDEN_EVERY == 0 else ""
+                cells = "".join(
+                    f'<c r="{column_letter(c)}{r}" t="inlineStr"><is><t>{escape(v)}</t></is></c>'
+                    for c, v in enumerate(values)
+                )
+                f.write(f'<row r="{r}"{hidden}>{cells}</row>'.encode())
+            f.write(b"</sheetData></worksheet>")
+
+
+def visible_rows(fmt: str, rows: int) -> int:
+    if fmt == "xlsx":
+        # 第 1 列是標題，資料列為 2..rows+1
+        return rows - sum(1 for r in range(2, rows + 2) if r % HIDDEN_EVERY == 0)
+    return rows
+
+
+def ensure_recipients(fmt: str, rows: int) -> Path:
+    path = DATA_DIR / f"recipients-{rows}.{fmt}"
+    if not path.exists():
+        DATA_DIR.mkdir(exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        (write_xlsx if fmt == "xlsx" else write_csv)(tmp, rows)
+        os.replace(tmp, path)
+    return path
+
+
+def ensure_assets(
+    images: int, attachment_kb: int, template_name: str = "personal"
+) -> tuple[Path, list[Path], list[Path]]:
+    """產生 HTML 範本、嵌入圖片與附件（內容是固定種子的隨機位元組）。"""
+    DATA_DIR.mkdir(exist_ok=True)
+    template = DATA_DIR / f"template-{template_name}.html"
+    template.write_text(TEMPLATES[template_name], encoding="utf-8")
+    rng = random.Random(0)
+    image_paths = []
+    for n in range(images):
+        path = DATA_DIR / f"image{n + 1}.png"
+        if not path.exists():
+            path.write_bytes(rng.randbytes(20 * 1024))
+        image_paths.append(path)
+    attachments = []
+    if attachment_kb:
+        path = DATA_DIR / f"attachment-{attachment_kb}k.bin"
+        if not path.exists():
+            path.write_bytes(rng.randbytes(attachment_kb * 1024))
+        attachments.append(path)
+    return template, image_paths, attachments
+
+
+# ─────────────────────────────
+# 📮 SMTP sink
+# ─────────────────────────────
+class SinkStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self.connections = 0
+        self.throttled = 0
+        self.dropped = 0
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Minimal ESMTP server that accepts and discards mail.
+
+    It has no TLS (run the client with STARTTLS off) and accepts any AUTH
+    PLAIN credentials. ``latency`` is added before each DATA reply. Every
+    ``throttle_every``-th message gets ``throttle_code``, and every
+    ``drop_every``-th message has its connection closed without a reply.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, latency=0.0, throttle_every=0, throttle_code=451, drop_every=0):
+        super().__init__(("127.0.0.1", 0), _SinkHandler)
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.throttle_code = throttle_code
+        self.drop_every = drop_every
+        self.stats = SinkStats()
+        self._counter = itertools.count(1)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "SmtpSink":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def next_message(self) -> int:
+        with self.stats.lock:
+            return next(self._counter)
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def setup(self) -> None:
+        super().setup()
+        # 管線化的回覆是一行一行寫出；關掉 Nagle 才不會被延遲 ACK 卡住 40 ms
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self) -> None:
+        server = self.server
+        with server.stats.lock:
+            server.stats.connections += 1
+        self.reply("220 sink.bench ESMTP ready")
+        rcpts = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self.wfile.write(
+                    b"250-sink.bench\r\n250-PIPELINING\r\n250-8BITMIME\r\n"
+                    b"250-SIZE 104857600\r\n250 AUTH PLAIN\r\n"
+                )
+            elif verb == b"HELO":
+                self.reply("250 sink.bench")
+            elif verb == b"AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == b"MAIL":
+                rcpts = 0
+                self.reply("250 2.1.0 OK")
+            elif verb == b"RCPT":
+                rcpts += 1
+                self.reply("250 2.1.5 OK")
+            elif verb == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                    size += len(data_line)
+                else:
+                    return
+                n = server.next_message()
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.drop_every and n % server.drop_every == 0:
+                    with server.stats.lock:
+                        server.stats.dropped += 1
+                    return
+                if server.throttle_every and n % server.throttle_every == 0:
+                    with server.stats.lock:
+                        server.stats.throttled += 1
+                    self.reply(f"{server.throttle_code} 4.7.1 Slow down")
+                    if server.throttle_code == 421:
+                        return
+                    continue
+                with server.stats.lock:
+                    server.stats.messages += 1
+                    server.stats.recipients += rcpts
+                    server.stats.bytes += size
+                self.reply(f"250 2.0.0 OK queued as {n}")
+            elif verb in (b"RSET", b"NOOP"):
+                self.reply("250 2.0.0 OK")
+            elif verb == b"QUIT":
+                self.reply("221 2.0.0 Bye")
+                return
+            else:
+                self.reply("502 5.5.2 Command not recognized")
+
+
+# ─────────────────────────────
+# 🏃 Runner
+# ─────────────────────────────
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_scenario(spec: dict) -> dict:
+    """在子行程中執行一個情境並回傳結果。"""
+    home = tempfile.mkdtemp(prefix="automailer-bench-")
+    os.environ["AUTOMAILER_HOME"] = home  # 紀錄、快取都寫到暫存資料夾
+    sys.path.insert(0, str(REPO_DIR))
+    import automailer
+
+    # 多帳號時每個帳號各有一個接收端，模擬不同的轉送伺服器
+    sinks = [
+        SmtpSink(
+            latency=spec["latency_ms"] / 1000,
+            throttle_every=spec["throttle_every"],
+            throttle_code=spec["throttle_code"],
+            drop_every=spec["drop_every"],
+        ).start()
+        for _ in range(max(1, spec["accounts"]))
+    ]
+    accounts = []
+    if spec["accounts"]:
+        accounts = [
+            {"name": f"relay{n}", "port": sink.port, "workers": spec["workers"]}
+            for n, sink in enumerate(sinks)
+        ]
+    template, images, attachments = ensure_assets(
+        spec["images"], spec["attachment_kb"], spec["template"]
+    )
+    embedded = {automailer.safe_cid(p.stem): p for p in images}
+    metrics = automailer.Metrics()
+    pause_event = threading.Event()
+    pause_event.set()
+    finished = {}
+
+    started = time.perf_counter()
+    automailer.run_automailer(
+        spec["mode"],
+        spec["recipients"],
+        "",
+        automailer.ALL_SHEETS,
+        automailer.ALL_SHEETS,
+        str(template),
+        lambda *args: None,
+        lambda msg: None,
+        embedded,
+        attachments,
+        pause_event,
+        threading.Event(),
+        lambda last_index, total: finished.update(total=total),
+        "",
+        "SMTP",
+        "127.0.0.1",
+        str(sinks[0].port),
+        "bench@bench.example",
+        "secret",
+        # 通用範本只用一句結尾詞，內容才會完全相同
+        automailer.DEFAULT_CLOSING_STATEMENTS[:1]
+        if spec["template"] == "generic"
+        else automailer.DEFAULT_CLOSING_STATEMENTS,
+        smtp_starttls=False,
+        smtp_async=spec["async"],
+        smtp_accounts=accounts,
+        smtp_batch_rcpt=spec["batch_rcpt"],
+        send_workers=spec["workers"],
+        render_processes=spec["render_processes"],
+        retry_base_seconds=spec["retry_base_s"],
+        rate_per_second=1e9,
+        rate_per_minute=1e9,
+        metrics_dir="",
+        image_max_width=0,  # 圖片是隨機位元組，不做最佳化
+        metrics=metrics,
+    )
+    elapsed = time.perf_counter() - started
+    for sink in sinks:
+        sink.shutdown()
+
+    snap = metrics.snapshot()
+    sent = snap["counters"].get("messages_sent", 0)
+    return {
+        "name": spec["name"],
+        "spec": spec,
+        "elapsed_s": round(elapsed, 3),
+        "sent": sent,
+        "failed": snap["counters"].get("messages_failed", 0),
+        "expected": spec["expected"],
+        "msgs_per_s": round(sent / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "phases": {
+            name: {
+                "count": data["count"],
+                "total_s": round(data["sum"], 4),
+                "mean_ms": round(data["mean"] * 1000, 4),
+                "p95_ms": round(data["p95"] * 1000, 4),
+            }
+            for name, data in sorted(snap["phases"].items())
+        },
+        "counters": snap["counters"],
+        "sink": {
+            field: sum(getattr(sink.stats, field) for sink in sinks)
+            for field in ("messages", "bytes", "connections", "throttled", "dropped")
+        },
+    }
+
+
+def build_scenarios(args) -> list[dict]:
+    rows = SCALES[args.scale]
+    scenarios = []
+    for fmt, workers in itertools.product(args.format.split(","), map(int, args.workers.split(","))):
+        path = ensure_recipients(fmt, rows)
+        scenarios.append(
+            {
+                "name": f"{fmt}-{args.scale}-w{workers}-{args.mode}"
+                + ("-async" if args.smtp_async else "")
+                + (f"-a{args.accounts}" if args.accounts else "")
+                + (f"-{args.template}" if args.template != "personal" else "")
+                + (f"-b{args.batch_rcpt}" if args.batch_rcpt > 1 else "")
+                + (f"-r{args.render_processes}" if args.render_processes else ""),
+                "recipients": str(path),
+                "format": fmt,
+                "rows": rows,
+                "expected": visible_rows(fmt, rows),
+                "workers": workers,
+                "mode": args.mode,
+                "async": args.smtp_async,
+                "accounts": args.accounts,
+                "template": args.template,
+                "batch_rcpt": args.batch_rcpt,
+                "render_processes": args.render_processes,
+                "retry_base_s": args.retry_base_s,
+                "latency_ms": args.latency_ms,
+                "throttle_every": args.throttle_every,
+                "throttle_code": args.throttle_code,
+                "drop_every": args.drop_every,
+                "images": args.images,
+                "attachment_kb": args.attachment_kb,
+            }
+        )
+    return scenarios
+
+
+def compare(results: list[dict], baseline: dict, max_regression: float) -> bool:
+    """印出與基準的差異；有情境比基準慢超過 max_regression % 時回傳 False。"""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    ok = True
+    print(f"\nvs baseline ({baseline.get('timestamp', '?')}):")
+    for result in results:
+        old = previous.get(result["name"])
+        if not old or not old.get("msgs_per_s") or not result["msgs_per_s"]:
+            print(f"  {result['name']}: no baseline")
+            continue
+        change = (result["msgs_per_s"] / old["msgs_per_s"] - 1) * 100
+        mark = "❌" if change < -max_regression else "  "
+        ok = ok and change >= -max_regression
+        rss = ""
+        if result["peak_rss_mb"] and old.get("peak_rss_mb"):
+            rss = f", RSS {result['peak_rss_mb'] - old['peak_rss_mb']:+.1f} MB"
+        print(f"{mark}{result['name']}: {change:+.1f}% msgs/s{rss}")
+    return ok
+
+
+def print_result(result: dict) -> None:
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] else "n/a"
+    print(
+        f"{result['name']}: {result['msgs_per_s']} msgs/s "
+        f"({result['sent']}/{result['expected']} sent, {result['failed']} failed, "
+        f"{result['elapsed_s']} s, peak RSS {rss})"
+    )
+    for name, phase in result["phases"].items():
+        print(
+            f"    {name:<12} {phase['total_s']:>9.3f} s total  "
+            f"{phase['mean_ms']:>9.3f} ms mean  {phase['p95_ms']:>9.3f} ms p95  (n={phase['count']})"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--format", default="csv,xlsx", help="csv、xlsx 或兩者以逗號分隔")
+    parser.add_argument("--workers", default="1", help="例如 1,4,8")
+    parser.add_argument("--mode", choices=["send", "draft"], default="send")
+    parser.add_argument("--async", dest="smtp_async", action="store_true",
+                        help="使用 AsyncSmtpBackend")
+    parser.add_argument("--accounts", type=int, default=0,
+                        help="以 N 個帳號（各自的接收端）分流寄送，每個帳號 --workers 條連線")
+    parser.add_argument("--template", choices=list(TEMPLATES), default="personal",
+                        help="generic：只依城市變化，搭配 --batch-rcpt 測試合併寄送")
+    parser.add_argument("--batch-rcpt", type=int, default=0,
+                        help="相同內容最多幾位收件人合併成一筆交易")
+    parser.add_argument("--render-processes", type=int, default=0,
+                        help="套版行程數（0 為自動，1 為不使用行程池）")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--throttle-code", type=int, default=451)
+    parser.add_argument("--drop-every", type=int, default=0)
+    parser.add_argument("--retry-base-s", type=float, default=1.0,
+                        help="第一次重寄前的等待秒數（程式預設 30，這裡縮短以免等太久）")
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--attachment-kb", type=int, default=100)
+    parser.add_argument("--json", help="把結果寫成 JSON 檔")
+    parser.add_argument("--baseline", help="與先前 --json 的結果比較")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_scenario(json.loads(args.child))))
+        return 0
+
+    results = []
+    for spec in build_scenarios(args):
+        # 每個情境用全新的子行程，peak RSS 才不會互相影響
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", json.dumps(spec)],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            print(f"❌ {spec['name']} failed:\n{proc.stderr}")
+            return 1
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            print("❌ throughput regressed beyond the allowed margin")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())